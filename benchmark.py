@@ -0,0 +1,1011 @@
+"""Benchmarks of helper.py
+
+e.g. python benchmark.py json-backends --lines 1000000
+"""
+
+import gzip
+import http.client
+import json
+import math
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import click
+
+import helper
+
+
+# generators
+def generate_rescued_log(outfile: str, lines: int, seed: int = 0, steps: int = 100):
+    """a rescued jsonline, `steps` train records and one valid record per epoch
+
+    train loss decays from about 1 to 0.05, with some noise
+    """
+    rng = random.Random(seed)
+    with open(outfile, "w") as OUT:
+        for n in range(lines):
+            epoch, step = divmod(n, steps + 1)
+            if step < steps:
+                loss = math.exp(-3 * n / lines) + rng.gauss(0, 0.02)
+                obj: Dict = {
+                    "epoch": epoch,
+                    "step": step,
+                    "train": round(loss, 4),
+                    "lr": 0.01,
+                    "wholestep": epoch * steps + step,
+                }
+            else:
+                obj = {"epoch": epoch, "valid": round(rng.random(), 4)}
+            print(json.dumps(obj), file=OUT)
+
+
+def generate_metrics_log(outfile: str, epochs: int, seed: int = 0, rows: int = 1):
+    """like the output of from-confusion-matrix-to-jsonline, `rows` per epoch and type"""
+    rng = random.Random(seed)
+    with open(outfile, "w") as OUT:
+        for epoch in range(epochs):
+            for _ in range(rows):
+                for type_ in ("train", "val"):
+                    obj = {
+                        "acc": rng.random(),
+                        "normal_acc": rng.random(),
+                        "luad_acc": rng.random(),
+                        "lusc_acc": rng.random(),
+                        "epoch": epoch,
+                        "type": type_,
+                    }
+                    print(json.dumps(obj), file=OUT)
+
+
+# the three legacy shapes handled by TemporaryConverter.convert_old_formats
+LEGACY_SHAPES = ("log_9", "log_100", "log")
+
+
+def legacy_records(
+    shape: str, lines: int, seed: int = 0, steps: int = 100
+) -> Iterator[Dict]:
+    """
+    log_9 => {"epoch1": {"step0": {"train": 1.7113, "lr": 0.01}}}
+    log_100 => {"epoch2": {"valid": 1.0219}}
+    log => {"epoch0": {"step0": {"train": 1.2284, "lr": 0.01}}} and
+           {"epoch292": {"step1715": {}, "valid": 0.8156}} at the end of each epoch
+    """
+    rng = random.Random(seed)
+    for n in range(lines):
+        if shape == "log_9":
+            epoch, step = divmod(n, steps)
+            yield {
+                f"epoch{epoch}": {
+                    f"step{step}": {"train": round(rng.random(), 4), "lr": 0.01}
+                }
+            }
+        elif shape == "log_100":
+            yield {f"epoch{n}": {"valid": round(rng.random(), 4)}}
+        elif shape == "log":
+            epoch, step = divmod(n, steps + 1)
+            if step < steps:
+                yield {
+                    f"epoch{epoch}": {
+                        f"step{step}": {"train": round(rng.random(), 4), "lr": 0.01}
+                    }
+                }
+            else:
+                yield {
+                    f"epoch{epoch}": {
+                        f"step{steps - 1}": {},
+                        "valid": round(rng.random(), 4),
+                    }
+                }
+        else:
+            raise ValueError(f"Unknown shape({shape}), choose from {LEGACY_SHAPES}")
+
+
+# labels of the confusion matrices
+LABELS = ("normal", "luad", "lusc")
+
+
+def generate_confusion_matrix_tree(
+    outdir: str, epochs: int, seed: int = 0, samples: int = 300
+) -> str:
+    """<outdir>/confuse_matrix/{train,val}_epochN.csv, return the confuse_matrix folder
+
+    columns are the true labels, the diagonal grows with epochs
+    """
+    rng = random.Random(seed)
+    folder = Path(outdir) / "confuse_matrix"
+    folder.mkdir(parents=True, exist_ok=True)
+    k = len(LABELS)
+    for epoch in range(epochs):
+        for prefix in ("train_epoch", "val_epoch"):
+            p = 0.4 + 0.5 * epoch / max(epochs - 1, 1)
+            matrix = [[0] * k for _ in range(k)]
+            for column in range(k):
+                n = samples // k
+                correct = min(n, max(0, round(rng.gauss(n * p, n * 0.05))))
+                matrix[column][column] = correct
+                for _ in range(n - correct):
+                    row = rng.choice([r for r in range(k) if r != column])
+                    matrix[row][column] += 1
+            with open(folder / f"{prefix}{epoch}.csv", "w") as OUT:
+                print(",".join(LABELS), file=OUT)
+                for counts in matrix:
+                    print(",".join(map(str, counts)), file=OUT)
+    return str(folder)
+
+
+def generate_sweep(outdir: str, configs: int, epochs: int, seed: int = 0) -> Dict:
+    """configs of a sweep, with their confusion matrices and jsonlines
+
+    returns paths of the folder list, subset_json_list and a plot-jsonline2 config
+    """
+    root = Path(outdir)
+    root.mkdir(parents=True, exist_ok=True)
+    folder_lines, subset_lines = [], []
+    for n in range(configs):
+        name = f"config.{n}.json"
+        config = root / name
+        with open(config, "w") as OUT:
+            json.dump({"lr": 10 ** -(n % 4 + 1), "optimizer_name": "sgd"}, OUT)
+        with open(f"{config}.subset.json", "w") as OUT:
+            json.dump({"lr": 10 ** -(n % 4 + 1)}, OUT)
+        folder = generate_confusion_matrix_tree(str(root / f"run{n}"), epochs, seed + n)
+        jsonline = str(root / f"{name}.cf_jsonline")
+        generate_metrics_log(jsonline, epochs, seed + n)
+        folder_lines.append(f"{folder}\t{config}")
+        subset_lines.append(f"{name}\t{config}.subset.json\t{jsonline}")
+    res = {
+        "folder_list": str(root / "folder_list"),
+        "subset_json_list": str(root / "subset_json_list"),
+        "plot_config": str(root / "plot.config.json"),
+    }
+    with open(res["folder_list"], "w") as OUT:
+        print("\n".join(folder_lines), file=OUT)
+    with open(res["subset_json_list"], "w") as OUT:
+        print("\n".join(subset_lines), file=OUT)
+    grid = math.ceil(configs / 4)
+    plot_config = {
+        "class_name": "CombinedPlotter1",
+        "infile": res["folder_list"],
+        "outfile": str(root / "combined.png"),
+        "sns": {
+            "context": "talk",
+            "palette": "Blues",
+            "x": "epoch",
+            "y": ["acc", "normal_acc", "luad_acc", "lusc_acc"],
+            "figsize": [30, 12 * grid],
+            "plot_grid": [grid, 4],
+        },
+    }
+    with open(res["plot_config"], "w") as OUT:
+        json.dump(plot_config, OUT)
+    return res
+
+
+def generate_legacy_log(outfile: str, shape: str, lines: int, seed: int = 0):
+    with open(outfile, "w") as OUT:
+        print("# legacy log", file=OUT)
+        for obj in legacy_records(shape, lines, seed):
+            print(json.dumps(obj), file=OUT)
+
+
+def legacy_convert_old_formats(obj: Dict) -> Dict:
+    """TemporaryConverter.convert_old_formats before it was compiled/cached"""
+    pat = re.compile("(\\D+)(\\d+)")
+
+    def get_number_from_key(d: Dict) -> List[Tuple[str, int]]:
+        res = []
+        for key, value in d.items():
+            m = pat.match(key)
+            if m:
+                column, value2 = m.groups()
+                res.append((column, int(value2)))
+            if isinstance(value, dict):
+                res.extend(get_number_from_key(value))
+            if not m:
+                res.append((key, value))
+        return res
+
+    return dict(get_number_from_key(obj))
+
+
+# report
+def timeit(func: Callable[[], object], repeat: int = 1) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_with_rusage(args: List[str]) -> Tuple[float, int]:
+    """(wall seconds, peak RSS in KB) of a subprocess"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args)
+    return time.perf_counter() - start, rusage.ru_maxrss
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def run_serve(
+    args: List[str], socket_path: str, plot_config: str, requests: int
+) -> Tuple[float, int]:
+    """(wall seconds of `requests` POST /plot of plot_config, peak RSS in KB) of
+    `serve --socket socket_path`, the first request renders, the others are cached
+    """
+    with open(plot_config) as IN:
+        body = json.dumps({k: v for k, v in json.load(IN).items() if k != "outfile"})
+    proc = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while not os.path.exists(socket_path):
+        if proc.poll() is not None or time.monotonic() > deadline:
+            proc.kill()
+            raise subprocess.CalledProcessError(proc.wait(), args)
+        time.sleep(0.05)
+    try:
+        start = time.perf_counter()
+        for _ in range(requests):
+            conn = UnixHTTPConnection(socket_path)
+            conn.request("POST", "/plot?format=png", body)
+            response = conn.getresponse()
+            content = response.read()
+            conn.close()
+            if response.status != 200:
+                raise RuntimeError(f"{response.status}: {content[:200]!r}")
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        _, _, rusage = os.wait4(proc.pid, 0)
+    return elapsed, rusage.ru_maxrss
+
+
+def print_table(rows: List[Dict]):
+    columns = list(rows[0])
+    print("\t".join(columns))
+    for row in rows:
+        print(
+            "\t".join(
+                f"{row[c]:.0f}" if isinstance(row[c], float) else str(row[c])
+                for c in columns
+            )
+        )
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command("json-backends", help="lines/sec of each json backend")
+@click.option("--lines", default=1_000_000, show_default=True)
+@click.option("--repeat", default=1, show_default=True)
+def json_backends(lines, repeat):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        infile = str(Path(tmpdir) / "rescued.jsonline")
+        outfile = str(Path(tmpdir) / "out.jsonline")
+        generate_rescued_log(infile, lines)
+        records = list(helper.JsonlineReader(infile).iter_parsed())
+
+        rows = []
+        backends = ["stdlib"] + (["orjson"] if helper.orjson is not None else [])
+        for name in backends:
+            helper.set_json_backend(name)
+
+            def read():
+                for _ in helper.JsonlineReader(infile).iter_parsed():
+                    pass
+
+            def write_print():
+                with open(outfile, "w") as OUT:
+                    for record in records:
+                        print(helper.JSON.dumps(record), file=OUT)
+
+            def write_chunked():
+                with open(
+                    outfile, "w", buffering=helper.IO_BUFFER_SIZE
+                ) as OUT, helper.JsonlineWriter(OUT) as writer:
+                    for record in records:
+                        writer.write(record)
+
+            rows.append(
+                {
+                    "backend": name,
+                    "stage": "read",
+                    "lines/sec": lines / timeit(read, repeat),
+                }
+            )
+            rows.append(
+                {
+                    "backend": name,
+                    "stage": "write(print)",
+                    "lines/sec": lines / timeit(write_print, repeat),
+                }
+            )
+            rows.append(
+                {
+                    "backend": name,
+                    "stage": "write(chunked)",
+                    "lines/sec": lines / timeit(write_chunked, repeat),
+                }
+            )
+
+        try:
+            import pandas as pd
+        except ImportError:
+            pass
+        else:
+            elapsed = timeit(lambda: pd.read_json(infile, lines=True), repeat)
+            rows.append(
+                {
+                    "backend": "pandas",
+                    "stage": "read_json(lines=True)",
+                    "lines/sec": lines / elapsed,
+                }
+            )
+        print_table(rows)
+
+
+@cli.command(
+    "line-reading",
+    help="lines/sec of splitting an uncompressed jsonline, buffered text vs mmap",
+)
+@click.option("--lines", default=1_000_000, show_default=True)
+@click.option("--repeat", default=3, show_default=True)
+def line_reading(lines, repeat):
+    import mmap
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        infile = str(Path(tmpdir) / "rescued.jsonline")
+        generate_rescued_log(infile, lines)
+
+        def buffered():
+            # what `helper.open_input` does
+            with helper.open_input(infile) as IN:
+                for _ in IN:
+                    pass
+
+        def mmap_readline():
+            with open(infile, "rb") as IN, mmap.mmap(
+                IN.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mm:
+                for line in iter(mm.readline, b""):
+                    line.decode()
+
+        def mmap_split():
+            with open(infile, "rb") as IN, mmap.mmap(
+                IN.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mm:
+                start, size = 0, len(mm)
+                while start < size:
+                    end = mm.rfind(b"\n", start, start + helper.IO_BUFFER_SIZE) + 1
+                    if end <= start:
+                        end = size
+                    for _ in mm[start:end].decode().split("\n"):
+                        pass
+                    start = end
+
+        def parse():
+            with helper.open_input(infile) as IN:
+                for _ in helper.parse_jsonlines(IN):
+                    pass
+
+        rows = [
+            {"reader": name, "lines/sec": lines / timeit(func, repeat)}
+            for name, func in [
+                ("open (buffered text)", buffered),
+                ("mmap + readline", mmap_readline),
+                ("mmap + split of 1MB chunks", mmap_split),
+                ("open + parse_jsonlines", parse),
+            ]
+        ]
+        print_table(rows)
+
+
+@cli.command("flatten", help="records/sec of convert_old_formats, old vs new")
+@click.option("--lines", default=200_000, show_default=True)
+@click.option("--repeat", default=3, show_default=True)
+def flatten(lines, repeat):
+    rows = []
+    for shape in LEGACY_SHAPES:
+        records = list(legacy_records(shape, lines))
+        converter = helper.TemporaryConverter("", "")
+        expected = [legacy_convert_old_formats(obj) for obj in records]
+        got = [converter.convert_old_formats(obj) for obj in records]
+        assert got == expected and all(
+            list(a) == list(b) for a, b in zip(got, expected)
+        ), shape
+
+        def old():
+            for obj in records:
+                legacy_convert_old_formats(obj)
+
+        def new():
+            for obj in records:
+                converter.convert_old_formats(obj)
+
+        old_speed = lines / timeit(old, repeat)
+        new_speed = lines / timeit(new, repeat)
+        rows.append(
+            {
+                "shape": shape,
+                "old records/sec": old_speed,
+                "new records/sec": new_speed,
+                "speedup": f"{new_speed / old_speed:.2f}x",
+            }
+        )
+    print_table(rows)
+
+
+@cli.command("downsample", help="render time and visual error of downsampling")
+@click.option("--steps", default=1_000_000, show_default=True)
+@click.option("--max-points", default=2000, show_default=True)
+@click.option(
+    "--with-ci/--without-ci",
+    default=False,
+    show_default=True,
+    help="also render all points with seaborn's confidence interval (very slow)",
+)
+def downsample(steps, max_points, with_ci):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import numpy as np
+    import pandas as pd
+    import seaborn as sns  # type: ignore
+    from matplotlib import pyplot as plt
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        infile = str(Path(tmpdir) / "rescued.jsonline")
+        # one valid record per 100 steps
+        generate_rescued_log(infile, steps + steps // 100)
+        reader = helper.JsonlineReader(infile)
+        [(_, columns)] = reader.only_columns_with_y(["train"], ["wholestep"])
+    df = pd.DataFrame(columns)
+    limits = (df.wholestep.min(), df.wholestep.max()), (df.train.min(), df.train.max())
+    plot = helper.Plot("", "")
+
+    def render(data: "pd.DataFrame", **kwargs) -> Tuple[float, "np.ndarray"]:
+        start = time.perf_counter()
+        fig, ax = plt.subplots(figsize=(12, 4), dpi=100)
+        sns.lineplot(x="wholestep", y="train", data=data, ax=ax, **kwargs)
+        ax.set_xlim(*limits[0])
+        ax.set_ylim(*limits[1])
+        fig.canvas.draw()
+        image = np.asarray(fig.canvas.buffer_rgba())[..., :3].mean(axis=-1)  # type: ignore[attr-defined]
+        plt.close(fig)
+        return time.perf_counter() - start, image
+
+    no_ci = plot.get_lineplot_kwargs(ci=False)
+    elapsed, reference = render(df, **no_ci)
+    rows = [
+        {
+            "method": "none",
+            "points": len(df),
+            "render sec": f"{elapsed:.2f}",
+            "visual error %": "0",
+        }
+    ]
+    if with_ci:
+        elapsed, _ = render(df)
+        rows.append(
+            {
+                "method": "none (ci)",
+                "points": len(df),
+                "render sec": f"{elapsed:.2f}",
+                "visual error %": "-",
+            }
+        )
+    for method in helper.DOWNSAMPLE_METHODS:
+        start = time.perf_counter()
+        reduced = helper.downsample_frame(
+            df, "wholestep", "train", [], max_points, method
+        )
+        reduce_time = time.perf_counter() - start
+        elapsed, image = render(reduced, **no_ci)
+        error = np.abs(image - reference).mean() / 255 * 100
+        rows.append(
+            {
+                "method": method,
+                "points": len(reduced),
+                "render sec": f"{reduce_time + elapsed:.2f}",
+                "visual error %": f"{error:.3f}",
+            }
+        )
+    print_table(rows)
+
+
+@cli.command("melt-memory", help="peak RSS of CombinedPlotter1.to_df, by chunk_size")
+@click.option("--epochs", default=200_000, show_default=True)
+@click.option("--chunk-size", default=1 << 16, show_default=True)
+def melt_memory(epochs, chunk_size):
+    helper_dir = str(Path(__file__).parent)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        infile = str(Path(tmpdir) / "metrics.jsonline")
+        generate_metrics_log(infile, epochs)
+        code = (
+            "import sys; sys.path.insert(0, sys.argv[1]); import helper, pandas; "
+            "helper.CombinedPlotter1('', '').to_df('a', sys.argv[2], ['epoch'], "
+            "['acc', 'normal_acc', 'luad_acc', 'lusc_acc'], int(sys.argv[3]))"
+        )
+        imports = "import sys; sys.path.insert(0, sys.argv[1]); import helper, pandas"
+        _, baseline = run_with_rusage([sys.executable, "-c", imports, helper_dir])
+        rows = []
+        for size in (0, chunk_size):
+            elapsed, rss = run_with_rusage(
+                [sys.executable, "-c", code, helper_dir, infile, str(size)]
+            )
+            rows.append(
+                {
+                    "chunk_size": size or "- (pd.melt)",
+                    "records": epochs * 2,
+                    "sec": f"{elapsed:.2f}",
+                    "peak RSS MB": rss / 1024,
+                    "over imports MB": (rss - baseline) / 1024,
+                }
+            )
+    print_table(rows)
+
+
+@cli.command("df-formats", help="write/read time of the .df of CombinedPlotter1")
+@click.option("--configs", default=100, show_default=True)
+@click.option("--epochs", default=1000, show_default=True)
+@click.option("--repeat", default=1, show_default=True)
+def df_formats(configs, epochs, repeat):
+    import pandas as pd
+
+    plotter = helper.CombinedPlotter1("", "")
+    y = ["acc", "normal_acc", "luad_acc", "lusc_acc"]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        frames = []
+        for n in range(configs):
+            infile = str(Path(tmpdir) / f"config.{n}.json.cf_jsonline")
+            generate_metrics_log(infile, epochs, seed=n)
+            frames.append(plotter.to_df(f"config.{n}.json", infile, ["epoch"], y))
+        df = pd.concat(frames)
+        outfile = str(Path(tmpdir) / "combined.png")
+        rows = []
+        for df_format in helper.DF_FORMATS:
+            if df_format == "none":
+                continue
+            path = ""
+
+            def write():
+                nonlocal path
+                path = helper.save_combined_df(df, outfile, df_format)
+
+            write_time = timeit(write, repeat)
+            read_time = timeit(lambda: helper.load_combined_df(path), repeat)
+            rows.append(
+                {
+                    "format": df_format,
+                    "rows": len(df),
+                    "MB": f"{os.path.getsize(path) / (1 << 20):.1f}",
+                    "write sec": f"{write_time:.2f}",
+                    "read sec": f"{read_time:.2f}",
+                }
+            )
+    print_table(rows)
+
+
+def suite_cases(tmpdir: str, lines: List[int], epochs: List[int], configs: int):
+    """(case, items, generate, helper.py args) of every CLI command, inputs are
+    generated lazily
+
+    args of `serve` is a function of the path of helper.py, see `run_serve`
+    """
+    root = Path(tmpdir)
+    for size in lines:
+        for shape in LEGACY_SHAPES:
+            legacy = str(root / f"{shape}.{size}.txt")
+
+            def generate_legacy(legacy=legacy, shape=shape, size=size):
+                generate_legacy_log(legacy, shape, size)
+
+            yield (
+                f"normalize-old-formats[{shape},lines={size}]",
+                size,
+                generate_legacy,
+                ["normalize-old-formats", "-i", legacy, "-o", legacy + ".out"],
+            )
+            yield (
+                f"normalize-and-rescue[{shape},lines={size}]",
+                size,
+                None,
+                ["normalize-and-rescue", "-i", legacy, "-o", legacy + ".rescued"],
+            )
+        yield (
+            f"normalize-and-rescue-batch[files={len(LEGACY_SHAPES)},lines={size}]",
+            size * len(LEGACY_SHAPES),
+            None,
+            [
+                "normalize-and-rescue-batch",
+                "-o",
+                str(root / f"batch.{size}"),
+                *(str(root / f"{shape}.{size}.txt") for shape in LEGACY_SHAPES),
+            ],
+        )
+        rescued = str(root / f"rescued.{size}.jsonline")
+
+        def generate_rescued(rescued=rescued, size=size):
+            generate_rescued_log(rescued, size)
+
+        yield (
+            f"rescue-normalized-file[lines={size}]",
+            size,
+            generate_rescued,
+            ["rescue-normalized-file", "-i", rescued, "-o", rescued + ".out"],
+        )
+
+        def generate_gzip(rescued=rescued):
+            with open(rescued, "rb") as IN, gzip.open(rescued + ".gz", "wb") as OUT:
+                shutil.copyfileobj(IN, OUT)
+
+        yield (
+            f"rescue-normalized-file[gzip,lines={size}]",
+            size,
+            generate_gzip,
+            ["rescue-normalized-file", "-i", rescued + ".gz", "-o", rescued + ".out"],
+        )
+        yield (
+            f"plot-jsonline[lines={size}]",
+            size,
+            None,
+            [
+                "plot-jsonline",
+                "-i",
+                rescued,
+                "-o",
+                rescued + ".png",
+                "--sns-palette",
+                "Blues",
+                # every step is a point otherwise, too slow to be useful
+                "--max-points",
+                "2000",
+            ],
+        )
+    for size in epochs:
+        outdir = str(root / f"sweep.{size}")
+
+        def generate_sweep_files(outdir=outdir, size=size):
+            files = generate_sweep(outdir, configs, size)
+            # plot-jsonline2-batch: views of the same infile, its jsonlines are
+            # loaded once
+            with open(files["plot_config"]) as IN:
+                plot_config = json.load(IN)
+            for n, y in enumerate(plot_config["sns"]["y"]):
+                view = {
+                    **plot_config,
+                    "outfile": str(Path(outdir) / f"combined.{y}.png"),
+                    "sns": {**plot_config["sns"], "y": [y], "plot_grid": [1, 4]},
+                }
+                with open(Path(outdir) / f"plot.config.{n}.json", "w") as OUT:
+                    json.dump(view, OUT)
+            # find-confusion-matrix-folders: json files of the run folders
+            json_output = Path(outdir) / "json_output"
+            json_output.mkdir(exist_ok=True)
+            for n in range(configs):
+                shutil.copy(Path(outdir) / f"config.{n}.json", json_output / f"run{n}")
+
+        folder = str(Path(outdir) / "run0" / "confuse_matrix")
+        yield (
+            f"from-confusion-matrix-to-jsonline[epochs={size}]",
+            size * 2,
+            generate_sweep_files,
+            ["from-confusion-matrix-to-jsonline", "-i", folder, "-o", outdir + "/cf"],
+        )
+        folder_list = str(Path(outdir) / "folder_list")
+        subset_json_list = str(Path(outdir) / "subset_json_list")
+        yield (
+            f"from-confusion-matrix-folders-to-jsonline[configs={configs},epochs={size}]",
+            size * 2 * configs,
+            None,
+            [
+                "from-confusion-matrix-folders-to-jsonline",
+                "-i",
+                folder_list,
+                "-o",
+                outdir + "/folders",
+            ],
+        )
+        yield (
+            f"summarize-jsonlines[configs={configs},epochs={size}]",
+            size * 2 * configs,
+            None,
+            [
+                "summarize-jsonlines",
+                "-i",
+                subset_json_list,
+                "-o",
+                outdir + "/summary.tsv",
+                "-s",
+                "max:acc",
+                "-s",
+                "argmax:acc",
+                "-s",
+                "last:lusc_acc",
+            ],
+        )
+        yield (
+            f"plot-jsonline2[configs={configs},epochs={size}]",
+            size * 2 * configs,
+            None,
+            [
+                "plot-jsonline2",
+                "--config-json",
+                str(Path(outdir) / "plot.config.json"),
+                subset_json_list,
+            ],
+        )
+        views = [str(Path(outdir) / f"plot.config.{n}.json") for n in range(4)]
+        yield (
+            f"plot-jsonline2-batch[configs={configs},epochs={size},views=4]",
+            size * 2 * configs * len(views),
+            None,
+            ["plot-jsonline2-batch", "--any-info", subset_json_list, *views],
+        )
+        config_jsons = [str(Path(outdir) / f"config.{n}.json") for n in range(configs)]
+        yield (
+            f"subset-json[epochs={size}]",
+            1,
+            None,
+            [
+                "subset-json",
+                "-i",
+                config_jsons[0],
+                "-o",
+                outdir + "/subset.json",
+                "lr",
+                "optimizer_name",
+            ],
+        )
+        yield (
+            f"subset-json-batch[configs={configs}]",
+            configs,
+            None,
+            [
+                "subset-json-batch",
+                "-o",
+                outdir + "/subset_index.json",
+                "-s",
+                "lr",
+                "-s",
+                "optimizer_name",
+                *config_jsons,
+            ],
+        )
+        yield (
+            f"find-confusion-matrix-folders[configs={configs},epochs={size}]",
+            configs,
+            None,
+            [
+                "find-confusion-matrix-folders",
+                "-o",
+                outdir + "/found_folder_list",
+                "--pattern",
+                r"^run\d+$",
+                outdir,
+            ],
+        )
+        socket_path = outdir + "/serve.sock"
+        plot_config = str(Path(outdir) / "plot.config.json")
+
+        def serve_requests(
+            helper_py,
+            socket_path=socket_path,
+            plot_config=plot_config,
+            subset_json_list=subset_json_list,
+        ):
+            args = ["serve", "--socket", socket_path, "-j", "1"]
+            args += ["--any-info", subset_json_list]
+            return run_serve(
+                [sys.executable, helper_py, *args], socket_path, plot_config, 10
+            )
+
+        yield (
+            f"serve[configs={configs},epochs={size},requests=10]",
+            10,
+            None,
+            serve_requests,
+        )
+
+
+def parse_sizes(sizes: str) -> List[int]:
+    return [int(float(size)) for size in sizes.split(",") if size]
+
+
+@cli.command("suite", help="time and peak RSS of every CLI command")
+@click.option(
+    "--lines",
+    default="10000,100000,1000000",
+    show_default=True,
+    help="sizes of logs, up to e.g. 1e7",
+)
+@click.option(
+    "--epochs",
+    default="10,100,1000",
+    show_default=True,
+    help="epochs of confusion matrices",
+)
+@click.option("--configs", default=8, show_default=True, help="configs of a sweep")
+@click.option("--only", default="", help="only cases containing this string")
+@click.option("--repeat", default=1, show_default=True, help="best of REPEAT runs")
+@click.option("--save", default="", help="save results as a baseline (json)")
+@click.option("--compare", default="", help="compare with a saved baseline")
+@click.option(
+    "--tolerance",
+    default=0.25,
+    show_default=True,
+    help="a case regresses if time or peak RSS is this much above the baseline",
+)
+def suite(lines, epochs, configs, only, repeat, save, compare, tolerance):
+    helper_py = str(Path(__file__).parent / "helper.py")
+    os.environ["MPLBACKEND"] = "Agg"
+    baseline = {}
+    if compare:
+        with open(compare) as IN:
+            baseline = json.load(IN)["results"]
+    results: Dict[str, Dict] = {}
+    rows = []
+    regressions = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cases = suite_cases(tmpdir, parse_sizes(lines), parse_sizes(epochs), configs)
+        for case, items, generate, args in cases:
+            if generate:
+                generate()
+            if only not in case:
+                continue
+            runs = [
+                (
+                    args(helper_py)
+                    if callable(args)
+                    else run_with_rusage([sys.executable, helper_py, *args])
+                )
+                for _ in range(repeat)
+            ]
+            elapsed, rss = min(t for t, _ in runs), min(r for _, r in runs)
+            result = {
+                "sec": elapsed,
+                "items/sec": items / elapsed,
+                "peak RSS MB": rss / 1024,
+            }
+            results[case] = result
+            row = {"case": case, **result}
+            if case in baseline:
+                base = baseline[case]
+                time_ratio = elapsed / base["sec"]
+                rss_ratio = result["peak RSS MB"] / base["peak RSS MB"]
+                row["vs baseline"] = f"time {time_ratio:.2f}x, RSS {rss_ratio:.2f}x"
+                if max(time_ratio, rss_ratio) > 1 + tolerance:
+                    regressions.append(case)
+            rows.append(row)
+            print(f"{case}: {elapsed:.2f}s", file=sys.stderr)
+    for row in rows:
+        row["sec"] = f"{row['sec']:.2f}"
+        row.setdefault("vs baseline", "-")
+    print_table(rows)
+    if save:
+        meta = {"python": sys.version.split()[0], "platform": sys.platform}
+        with open(save, "w") as OUT:
+            json.dump({"meta": meta, "results": results}, OUT, indent=1)
+    if regressions:
+        sys.exit(f"{len(regressions)} regressions: {', '.join(regressions)}")
+
+
+# commands which don't plot, and modules they must not import
+NON_PLOTTING_COMMANDS = (
+    "normalize-old-formats",
+    "rescue-normalized-file",
+    "normalize-and-rescue",
+    "subset-json",
+    "subset-json-batch",
+    "summarize-jsonlines",
+    "find-confusion-matrix-folders",
+)
+PLOTTING_MODULES = ("numpy", "pandas", "seaborn", "matplotlib")
+
+
+def import_times(args: List[str]) -> Dict[str, int]:
+    """cumulative import time (us) of every top level module imported by `python -X importtime args`"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    res = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # nested imports are indented
+        if not name.startswith("  "):
+            res[name.strip()] = int(cumulative)
+    return res
+
+
+@cli.command("import-time", help="fail if non-plotting commands import too much")
+@click.option("--budget-ms", default=200, show_default=True)
+def import_time(budget_ms):
+    helper_py = str(Path(__file__).parent / "helper.py")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmpdir:
+        legacy = str(Path(tmpdir) / "log.txt")
+        normalized = str(Path(tmpdir) / "log.testout")
+        config = str(Path(tmpdir) / "config.json")
+        generate_legacy_log(legacy, "log", 100)
+        metrics = str(Path(tmpdir) / "config.json.cf_jsonline")
+        generate_metrics_log(metrics, 100)
+        subset_list = str(Path(tmpdir) / "subset_json_list")
+        with open(subset_list, "w") as OUT:
+            print(f"config.json\t{config}.subset\t{metrics}", file=OUT)
+        with open(config, "w") as OUT:
+            json.dump({"optimizer_name": "sgd"}, OUT)
+        args = {
+            "normalize-old-formats": ["-i", legacy, "-o", normalized],
+            "rescue-normalized-file": ["-i", normalized, "-o", normalized + ".rescued"],
+            "normalize-and-rescue": ["-i", legacy, "-o", legacy + ".rescued"],
+            "subset-json": ["-i", config, "-o", config + ".subset", "optimizer_name"],
+            "subset-json-batch": [
+                "-o",
+                config + ".index",
+                "-s",
+                "optimizer_name",
+                config,
+            ],
+            "find-confusion-matrix-folders": ["-o", subset_list + ".folders", tmpdir],
+            "summarize-jsonlines": [
+                "-i",
+                subset_list,
+                "-s",
+                "max:acc",
+                "--type",
+                "val",
+            ],
+        }
+        rows = []
+        for command in NON_PLOTTING_COMMANDS:
+            times = import_times([helper_py, command, *args[command]])
+            total_ms = sum(times.values()) / 1000
+            heavy = [m for m in PLOTTING_MODULES if m in times]
+            ok = total_ms <= budget_ms and not heavy
+            failed = failed or not ok
+            rows.append(
+                {
+                    "command": command,
+                    "import ms": total_ms,
+                    "plotting modules": ",".join(heavy) or "-",
+                    "ok": ok,
+                }
+            )
+    print_table(rows)
+    if failed:
+        sys.exit(
+            f"import time budget({budget_ms}ms) exceeded or plotting modules imported"
+        )
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,21 +1,81 @@
+from __future__ import annotations
+
+import csv
+import glob
+import hashlib
+import heapq
+import importlib
+import io
 import json
-import pdb
+import math
+import mmap
+import os
+import pickle
 import re
+import shutil
 import sys
+import tempfile
 import textwrap
+import time
+from array import array
+from concurrent import futures
+from contextlib import ExitStack, contextmanager, suppress
 from functools import wraps
 from pathlib import Path
-from typing import IO, Dict, Iterator, List, Tuple, Union, Any
-from xmlrpc.client import Boolean
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Dict,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    Any,
+)
 
 import click
-import glom  # type: ignore
-import numpy as np
-import pandas as pd
-import seaborn as sns  # type: ignore
-from matplotlib import pyplot as plt  # type: ignore
 from typing_extensions import TypeAlias
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+
+class LazyModule:
+    """Import a module on first use, and replace itself in globals with the module
+
+    numpy/pandas/seaborn/matplotlib (and glom) take about a second to import,
+    but the converting commands don't need them.
+    """
+
+    def __init__(self, name: str, alias: str):
+        self.name = name
+        self.alias = alias
+
+    def __getattr__(self, attr: str) -> Any:
+        module = importlib.import_module(self.name)
+        globals()[self.alias] = module
+        return getattr(module, attr)
+
+
+if TYPE_CHECKING:
+    import glom  # type: ignore
+    import numpy as np
+    import pandas as pd
+    import seaborn as sns  # type: ignore
+    from matplotlib import pyplot as plt  # type: ignore
+else:
+    glom = LazyModule("glom", "glom")
+    np = LazyModule("numpy", "np")
+    pd = LazyModule("pandas", "pd")
+    sns = LazyModule("seaborn", "sns")
+    plt = LazyModule("matplotlib.pyplot", "plt")
+
 
 # helper
 def should_ignore(temp: str) -> bool:
@@ -23,6 +83,649 @@ def should_ignore(temp: str) -> bool:
 
 
 ValueInDataFrame: TypeAlias = Union[float, str]
+# columnar records: column name => values, one value (or None) per record
+Columns: TypeAlias = Dict[str, List[Any]]
+
+
+def first_record_xs(xs: List[str], some_data: Columns) -> List[str]:
+    """xs in the first record of the columns, like `x0 in some_data[0]` of records
+
+    a null x of the first record counts as missing
+    """
+    return [x0 for x0 in xs if some_data.get(x0, [None])[0] is not None]
+
+
+# json backend
+def has_coerced_int(obj: Any) -> bool:
+    """obj (parsed by orjson) has a float out of the range of int64/uint64
+
+    orjson parses such integers as floats, json.loads keeps them as int
+    """
+    if type(obj) is dict:
+        obj = obj.values()
+    elif type(obj) is not list:
+        return type(obj) is float and not -(2**63) < obj < 2**64
+    for value in obj:
+        if type(value) is float:
+            if not -(2**63) < value < 2**64:
+                return True
+        elif (type(value) is dict or type(value) is list) and has_coerced_int(value):
+            return True
+    return False
+
+
+class JsonBackend:
+    """`loads`/`dumps` of one jsonline
+
+    name:
+        auto: orjson to read if it is installed, stdlib to write (the same output as stdlib)
+            lines with integers out of 64 bits are read by stdlib (orjson reads floats)
+        orjson: https://github.com/ijl/orjson, compact output, records with
+            NaN/Infinity are written by stdlib (orjson writes them as null)
+        stdlib: json.loads/json.dumps
+    """
+
+    names = ("auto", "orjson", "stdlib")
+
+    def __init__(self, name: str = "auto"):
+        if name not in self.names:
+            raise ValueError(f"Unknown json backend({name}), choose from {self.names}")
+        if name == "orjson" and orjson is None:
+            raise ValueError("json backend(orjson) is not installed")
+        # only `orjson` changes the output
+        self.compact = name == "orjson"
+        if name == "auto":
+            name = "orjson" if orjson is not None else "stdlib"
+        self.name = name
+        # separator between two items of a dumped dict
+        self.item_separator = "," if self.compact else ", "
+
+    def loads(self, temp: Union[str, bytes]) -> Any:
+        if self.name == "orjson":
+            try:
+                obj = orjson.loads(temp)
+            except orjson.JSONDecodeError:
+                # e.g. NaN/Infinity written by stdlib json
+                pass
+            else:
+                if not has_coerced_int(obj):
+                    return obj
+        return json.loads(temp)
+
+    def dumps_compact(self, obj: Any) -> Optional[str]:
+        """orjson output of obj, None if it is written by stdlib"""
+        if not self.compact or (
+            isinstance(obj, dict)
+            and any(isinstance(v, float) and not math.isfinite(v) for v in obj.values())
+        ):
+            return None
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+        except TypeError:
+            # not supported by orjson, e.g. subclass of float
+            return None
+
+    def dumps(self, obj: Any) -> str:
+        line = self.dumps_compact(obj)
+        return json.dumps(obj) if line is None else line
+
+
+JSON = JsonBackend(os.environ.get("JSONLINE_JSON_BACKEND", "auto"))
+
+
+def set_json_backend(name: str) -> JsonBackend:
+    """change the json backend used by all readers and writers (and subprocesses)"""
+    global JSON
+    JSON = JsonBackend(name)
+    os.environ["JSONLINE_JSON_BACKEND"] = name
+    return JSON
+
+
+class Profiler:
+    """Timings of the stages of a command, enabled by `cli --profile`
+
+    stages: wall/cpu seconds (inclusive, a stage can be in another) and calls
+    counters: e.g. records parsed/written
+    The report also has the bytes read/written (rchar/wchar of /proc/self/io,
+    so imported modules are counted too) and the peak RSS (KB) of the process
+    and of its finished subprocesses (e.g. workers of a process pool).
+    Stages of worker processes are not recorded.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.command = ""
+        self.start_wall = 0.0
+        self.start_cpu = 0.0
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.cprofile: Any = None
+
+    def start(self, command: str, cprofile: bool = False) -> None:
+        self.enabled = True
+        self.command = command
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        if cprofile:
+            import cProfile
+
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+            stage["calls"] += 1
+            stage["wall"] += time.perf_counter() - wall
+            stage["cpu"] += time.process_time() - cpu
+
+    def profiled(self, name: str):
+        """decorator, the whole function is a stage"""
+
+        def decorator(func):
+            @wraps(func)
+            def inner(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+
+            return inner
+
+        return decorator
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self) -> Dict[str, Any]:
+        import resource
+
+        res: Dict[str, Any] = {
+            "command": self.command,
+            "argv": sys.argv[1:],
+            "pid": os.getpid(),
+            "wall": time.perf_counter() - self.start_wall,
+            "cpu": time.process_time() - self.start_cpu,
+            # KB on linux
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "children_peak_rss": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        }
+        try:
+            with open("/proc/self/io") as IN:
+                io_info = dict(line.split(": ") for line in IN.read().splitlines())
+            res["bytes_read"] = int(io_info["rchar"])
+            res["bytes_written"] = int(io_info["wchar"])
+        except OSError:
+            pass
+        res["counters"] = self.counters
+        res["stages"] = {
+            name: {k: round(v, 6) for k, v in stage.items()}
+            for name, stage in self.stages.items()
+        }
+        return res
+
+    def stop(self, output: Optional[str] = "", cprofile_file: str = "") -> None:
+        """output: append the report as a json line to this file, "" for stderr, None for no report"""
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(cprofile_file)
+            self.cprofile = None
+        if output is not None:
+            line = json.dumps(self.report())
+            if output:
+                with open(output, "a") as OUT:
+                    print(line, file=OUT)
+            else:
+                print(line, file=sys.stderr)
+        self.enabled = False
+
+
+PROFILER = Profiler()
+
+
+class MemoStore:
+    """Outputs of commands, keyed by a hash of their inputs, enabled by `cli --memo-dir`
+
+    The key is a hash of the command, its parameters (without paths), the
+    formats of its outputs (e.g. a .png or .svg plot, a .gz jsonline), the
+    fingerprints of its input files and this helper.py, so a command whose
+    inputs have not changed copies its outputs from the store instead of
+    running again (e.g. when a sweep of `step2.nf` gets a few new configs).
+
+    digest:
+        content: a hash of the content of every input file, the hash is kept
+            in the store by path + size + mtime, so a file is read only once
+        stat: path + size + mtime of every input file, nothing is read
+    Names of input files are part of fingerprints, their folders are not, as
+    nextflow stages inputs in a new work folder for every task.
+    The store is at most max_bytes (0: no limit), least recently used entries
+    are removed first. Several processes can share one store.
+    """
+
+    digests = ("content", "stat")
+
+    def __init__(self, digest: str = "content"):
+        self.root = ""
+        self.max_bytes = 0
+        self.digest = digest
+        self.helper_digest = ""
+
+    def open(self, root: str, max_bytes: int = 0, digest: str = "content") -> None:
+        if digest not in self.digests:
+            raise ValueError(f"Unknown digest({digest}), choose from {self.digests}")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.digest = digest
+        for sub in ("entries", "digests", "tmp"):
+            Path(root, sub).mkdir(parents=True, exist_ok=True)
+        self.helper_digest = self.content_digest(__file__)
+
+    @staticmethod
+    def content_digest(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as IN:
+            for block in iter(lambda: IN.read(IO_BUFFER_SIZE), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def file_fingerprint(self, path: str) -> str:
+        real_path = os.path.realpath(path)
+        st = os.stat(real_path)
+        stat_key = f"{real_path}\t{st.st_size}\t{st.st_mtime_ns}"
+        if self.digest == "stat":
+            return stat_key
+        cached = Path(
+            self.root, "digests", hashlib.sha256(stat_key.encode()).hexdigest()
+        )
+        try:
+            digest = cached.read_text()
+            os.utime(cached)
+            return digest
+        except OSError:
+            pass
+        digest = self.content_digest(real_path)
+        self.write_atomic(cached, digest.encode())
+        return digest
+
+    def path_fingerprint(self, path: str) -> str:
+        """a file, or all files in a folder"""
+        if not os.path.isdir(path):
+            return f"{Path(path).name}:{self.file_fingerprint(path)}"
+        files = []
+        for folder, dirnames, filenames in os.walk(path, followlinks=True):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                file = os.path.join(folder, filename)
+                files.append(
+                    f"{os.path.relpath(file, path)}:{self.file_fingerprint(file)}"
+                )
+        return f"{Path(path).name}/[{','.join(files)}]"
+
+    def list_fingerprint(self, path: str, folders: bool = False) -> str:
+        """a file listing other files by tab separated fields, e.g. a folder list
+
+        listed paths are replaced by their fingerprints, content of listed
+        folders is only used with `folders`
+        """
+        lines = []
+        with open_input(path) as IN:
+            for line in IN:
+                temp = line.strip()
+                if should_ignore(temp):
+                    continue
+                fields = []
+                for field in temp.split("\t"):
+                    if os.path.isfile(field) or (folders and os.path.isdir(field)):
+                        field = self.path_fingerprint(field)
+                    elif os.path.isdir(field):
+                        field = Path(field).name + "/"
+                    fields.append(field)
+                lines.append("\t".join(fields))
+        return f"{Path(path).name}:[{';'.join(lines)}]"
+
+    @staticmethod
+    def output_formats(outputs: List[str]) -> List[str]:
+        """the last suffix and the compression (by the extension) of every output"""
+        return [
+            f"{Path(output).suffix}:{detect_compression(output, head=b'')}"
+            for output in outputs
+        ]
+
+    def key(
+        self, command: str, params: Dict[str, Any], inputs: List[Tuple[str, str]]
+    ) -> str:
+        fingerprints = []
+        for kind, path in inputs:
+            if kind == "path":
+                fingerprints.append(self.path_fingerprint(path))
+            elif kind == "list":
+                fingerprints.append(self.list_fingerprint(path))
+            elif kind == "list+folders":
+                fingerprints.append(self.list_fingerprint(path, folders=True))
+            else:
+                raise ValueError(f"Unknown kind of input({kind})")
+        text = json.dumps(
+            [self.helper_digest, JSON.compact, command, params, fingerprints],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def write_atomic(self, path: Path, data: bytes) -> None:
+        fd, temp = tempfile.mkstemp(dir=Path(self.root, "tmp"))
+        with os.fdopen(fd, "wb") as OUT:
+            OUT.write(data)
+        os.replace(temp, path)
+
+    def fetch(self, key: str, outputs: List[str]) -> bool:
+        entry = Path(self.root, "entries", key)
+        try:
+            os.utime(entry)
+            for n, output in enumerate(outputs):
+                Path(output).parent.mkdir(parents=True, exist_ok=True)
+                # copied, not linked: rewriting an output must not change the store
+                shutil.copyfile(entry / str(n), output)
+        except OSError:
+            # not stored, or removed by another process
+            return False
+        return True
+
+    def store(self, key: str, outputs: List[str]) -> None:
+        temp = tempfile.mkdtemp(dir=Path(self.root, "tmp"))
+        for n, output in enumerate(outputs):
+            shutil.copyfile(output, os.path.join(temp, str(n)))
+        try:
+            os.rename(temp, Path(self.root, "entries", key))
+        except OSError:
+            # stored by another process
+            shutil.rmtree(temp, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> None:
+        if not self.max_bytes:
+            return
+        items = []
+        for sub in ("entries", "digests"):
+            for item in os.scandir(Path(self.root, sub)):
+                try:
+                    if item.is_dir():
+                        size = sum(f.stat().st_size for f in os.scandir(item.path))
+                    else:
+                        size = item.stat().st_size
+                    items.append((item.stat().st_mtime, size, item.path))
+                except OSError:
+                    continue
+        total = sum(size for _, size, _ in items)
+        for _, size, path in sorted(items):
+            if total <= self.max_bytes:
+                break
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                with suppress(OSError):
+                    os.remove(path)
+            total -= size
+
+    def run(
+        self,
+        command: str,
+        params: Dict[str, Any],
+        inputs: List[Tuple[str, str]],
+        outputs: List[str],
+        func: Callable[[], Any],
+    ) -> Any:
+        """func() unless outputs of the same inputs are stored
+
+        params: json-able, without paths of inputs/outputs, formats of outputs
+            are added (see `output_formats`)
+        inputs: (kind, path), kind: path (file or folder), list, list+folders (see `list_fingerprint`)
+        outputs: files written by func
+        """
+        paths = [path for _, path in inputs] + outputs
+        if not self.root or "-" in paths:
+            return func()
+        with PROFILER.stage("memo"):
+            try:
+                params = {**params, "output_formats": self.output_formats(outputs)}
+                key = self.key(command, params, inputs)
+            except OSError:
+                # e.g. a missing input, func reports it
+                return func()
+            hit = self.fetch(key, outputs)
+        if hit:
+            PROFILER.count("memo_hits")
+            print(f"{command}: up to date, outputs are from {self.root} ({key[:12]})")
+            return None
+        PROFILER.count("memo_misses")
+        res = func()
+        if all(os.path.isfile(output) for output in outputs):
+            with PROFILER.stage("memo"):
+                self.store(key, outputs)
+        return res
+
+
+MEMO = MemoStore()
+
+
+# size of read/write buffer of jsonline files
+IO_BUFFER_SIZE = 1 << 20
+
+
+# compression => (extension, magic bytes)
+COMPRESSIONS = {
+    "gzip": (".gz", b"\x1f\x8b"),
+    "bz2": (".bz2", b"BZh"),
+    "xz": (".xz", b"\xfd7zXZ\x00"),
+    "zstd": (".zst", b"\x28\xb5\x2f\xfd"),
+}
+
+
+def detect_compression(path: str, head: Optional[bytes] = None) -> str:
+    """compression of path by its extension, or by its first bytes, "" if not compressed"""
+    for name, (extension, _) in COMPRESSIONS.items():
+        if path.endswith(extension):
+            return name
+    if head is None:
+        if path == "-" or not os.path.isfile(path):
+            return ""
+        with open(path, "rb") as IN:
+            head = IN.read(8)
+    for name, (_, magic) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    return ""
+
+
+def open_compressed(
+    fileobj: IO[bytes], compression: str, mode: str = "rb"
+) -> IO[bytes]:
+    """binary (de)compressing file object over fileobj"""
+    if compression == "zstd":
+        try:
+            zstandard = importlib.import_module("zstandard")
+        except ImportError:
+            raise ValueError("zstd needs zstandard, pip install zstandard")
+        if mode == "rb":
+            return zstandard.ZstdDecompressor().stream_reader(
+                fileobj, read_size=IO_BUFFER_SIZE
+            )
+        return zstandard.ZstdCompressor().stream_writer(fileobj)
+    module = importlib.import_module(
+        {"gzip": "gzip", "bz2": "bz2", "xz": "lzma"}[compression]
+    )
+    if compression == "gzip":
+        # the default level (9) is too slow for logs
+        return module.GzipFile(fileobj=fileobj, mode=mode, compresslevel=6)
+    return module.open(fileobj, mode)
+
+
+class ThreadedReader(io.RawIOBase):
+    """Read a binary stream (e.g. a decompressor) in a background thread, chunk by chunk
+
+    zlib/bz2/lzma/zstd release the GIL, so decompression overlaps with json parsing
+    """
+
+    def __init__(
+        self, raw: IO[bytes], chunk_size: int = IO_BUFFER_SIZE, chunks: int = 4
+    ):
+        import queue
+        import threading
+
+        self.raw = raw
+        self.chunk_size = chunk_size
+        self.queue: Any = queue.Queue(chunks)
+        self.stopped = False
+        self.eof = False
+        self.chunk = memoryview(b"")
+        self.thread = threading.Thread(target=self.read_chunks, daemon=True)
+        self.thread.start()
+
+    def put(self, item: Any) -> None:
+        import queue
+
+        while not self.stopped:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read_chunks(self) -> None:
+        try:
+            while not self.stopped:
+                chunk = self.raw.read(self.chunk_size)
+                self.put(chunk)
+                if not chunk:
+                    break
+        except Exception as e:
+            self.put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if not self.chunk:
+            if self.eof:
+                return 0
+            item = self.queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self.eof = True
+                return 0
+            self.chunk = memoryview(item)
+        n = min(len(buffer), len(self.chunk))
+        buffer[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self.stopped = True
+            self.thread.join()
+            self.raw.close()
+        super().close()
+
+
+@contextmanager
+def open_input(infile: str) -> Iterator[IO[str]]:
+    """open a jsonline for reading, `-` is stdin
+
+    gzip/bz2/xz/zstd (see `COMPRESSIONS`) are decompressed in a background thread
+    """
+    with ExitStack() as stack:
+        if infile == "-":
+            fileobj = sys.stdin.buffer
+            head = fileobj.peek(8)[:8] if hasattr(fileobj, "peek") else b""
+            compression = detect_compression(infile, head)
+            if not compression:
+                yield sys.stdin
+                return
+        else:
+            compression = detect_compression(infile)
+            if not compression:
+                # not mmap: splitting the lines of a mmap is within +-10% of the
+                # buffered text reader, which is about 10% of parse_jsonlines,
+                # see `benchmark.py line-reading`.
+                # mmap is used for random access, see `LineIndex.read_rows`
+                yield stack.enter_context(open(infile, buffering=IO_BUFFER_SIZE))
+                return
+            fileobj = stack.enter_context(open(infile, "rb", buffering=IO_BUFFER_SIZE))
+        # closed before fileobj
+        raw = ThreadedReader(open_compressed(fileobj, compression))
+        yield stack.enter_context(
+            io.TextIOWrapper(io.BufferedReader(raw, IO_BUFFER_SIZE))
+        )
+
+
+@contextmanager
+def open_output(outfile: str) -> Iterator[IO[str]]:
+    """open a jsonline for writing, `-` is stdout
+
+    compressed if outfile ends with an extension of `COMPRESSIONS`, e.g. `.gz`
+    """
+    if outfile == "-":
+        yield sys.stdout
+        sys.stdout.flush()
+        return
+    compression = detect_compression(outfile, head=b"")
+    if not compression:
+        with open(outfile, "w", buffering=IO_BUFFER_SIZE) as OUT:
+            yield OUT
+        return
+    with open(outfile, "wb") as RAW, io.TextIOWrapper(
+        io.BufferedWriter(open_compressed(RAW, compression, "wb"), IO_BUFFER_SIZE)  # type: ignore[arg-type]
+    ) as OUT:
+        yield OUT
+
+
+def parse_jsonlines(IN: Iterable[str]) -> Iterator[Dict]:
+    n = 0
+    try:
+        for line in IN:
+            temp = line.strip()
+            if should_ignore(temp):
+                continue
+            n += 1
+            yield JSON.loads(temp)
+    finally:
+        PROFILER.count("records", n)
+
+
+class JsonlineWriter:
+    """Write jsonlines in big chunks instead of one `print` per record"""
+
+    def __init__(self, OUT: IO[str], chunk_lines: int = 8192):
+        self.OUT = OUT
+        self.chunk_lines = chunk_lines
+        self.buffer: List[str] = []
+
+    def write(self, obj: Any) -> None:
+        self.write_line(JSON.dumps(obj))
+
+    def write_line(self, line: str) -> None:
+        self.buffer.append(line)
+        if len(self.buffer) >= self.chunk_lines:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            PROFILER.count("records_written", len(self.buffer))
+            self.buffer.append("")
+            self.OUT.write("\n".join(self.buffer))
+            self.buffer.clear()
+
+    def __enter__(self) -> "JsonlineWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
 
 
 def parsed_any_info(func):
@@ -55,6 +758,7 @@ class ConfusionMatrix:
         res["acc"] = res["acc"] / np.sum(np.sum(df))
         return res
 
+    @PROFILER.profiled("confusion_matrix.convert")
     def convert(
         self, infile_list: Dict[int, str], info: str
     ) -> List[Dict[str, ValueInDataFrame]]:
@@ -67,6 +771,79 @@ class ConfusionMatrix:
             res.append(acc_dict1)
         return res
 
+    @staticmethod
+    def read_matrix(csv_file: str) -> Tuple[List[str], np.ndarray]:
+        """labels (header) and the k x k matrix of a confusion matrix csv"""
+        with open(csv_file, newline="") as IN:
+            rows = list(csv.reader(IN))
+        labels = rows[0]
+        matrix = np.array([[float(v) for v in row] for row in rows[1:] if row])
+        return labels, matrix.reshape(len(matrix), -1)
+
+    def convert_batch(
+        self,
+        infile_list: Dict[int, str],
+        info: str,
+        extra_metrics: bool = False,
+        executor: Optional[futures.Executor] = None,
+    ) -> List[Dict[str, ValueInDataFrame]]:
+        """Same as `convert`, but calculate all epochs at once, see `calculate_batch`
+
+        csv files are read with executor if it is given
+        """
+        read = executor.map if executor else map
+        with PROFILER.stage("confusion_matrix.read"):
+            matrices = list(read(self.read_matrix, infile_list.values()))
+        return self.calculate_batch(list(infile_list), matrices, info, extra_metrics)
+
+    @PROFILER.profiled("confusion_matrix.calculate")
+    def calculate_batch(
+        self,
+        epochs: List[int],
+        matrices: List[Tuple[List[str], np.ndarray]],
+        info: str,
+        extra_metrics: bool = False,
+    ) -> List[Dict[str, ValueInDataFrame]]:
+        """all matrices are stacked as (epochs, k, k), as in `calculate_acc`:
+            {label}_acc = diagonal / sum of its column
+            acc = sum of diagonal / sum of matrix
+        extra_metrics (columns are the true labels, so {label}_acc is the recall):
+            {label}_precision = diagonal / sum of its row
+            {label}_f1 = harmonic mean of precision and recall
+        """
+        if not matrices:
+            return []
+        all_labels: List[str] = []
+        for labels, matrix in matrices:
+            assert matrix.shape == (len(labels), len(labels)), (labels, matrix.shape)
+            assert not all_labels or labels == all_labels, (all_labels, labels)
+            all_labels = labels
+        stacked = np.stack([matrix for _, matrix in matrices])
+        diagonal = np.diagonal(stacked, axis1=1, axis2=2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            columns: Dict[str, np.ndarray] = {
+                "acc": diagonal.sum(axis=1) / stacked.sum(axis=(1, 2))
+            }
+            recall = diagonal / stacked.sum(axis=1)
+            for n, label in enumerate(all_labels):
+                columns[f"{label}_acc"] = recall[:, n]
+            if extra_metrics:
+                precision = diagonal / stacked.sum(axis=2)
+                f1 = 2 * precision * recall / (precision + recall)
+                for n, label in enumerate(all_labels):
+                    columns[f"{label}_precision"] = precision[:, n]
+                    columns[f"{label}_f1"] = f1[:, n]
+        values = {name: column.tolist() for name, column in columns.items()}
+        res: List[Dict[str, ValueInDataFrame]] = []
+        for n, epoch_step in enumerate(epochs):
+            acc_dict1: Dict[str, ValueInDataFrame] = {
+                name: column[n] for name, column in values.items()
+            }
+            acc_dict1["epoch"] = epoch_step
+            acc_dict1["type"] = info
+            res.append(acc_dict1)
+        return res
+
     def find_csv_files(self, indir: str, prefix="train_epoch") -> Dict[int, str]:
         """
         e.g. /mnt/GPU1-raid0/zhaomeng-from-GPU3/projects/20220128-fl/Federated_learning/Tdeeppath/temp/config.5.20220207_175258.json/ckpt/inceptionv3_class3_0207/tile299/confuse_matrix
@@ -88,31 +865,460 @@ class ConfusionMatrix:
             res[k] = v
         return res
 
-    def run(self, any_info: List[str]):
+    def write(
+        self,
+        writer: JsonlineWriter,
+        train_info: List[Dict[str, ValueInDataFrame]],
+        val_info: List[Dict[str, ValueInDataFrame]],
+        any_info: List[str],
+        more_info: Dict[str, str] = {},
+    ) -> None:
+        # train
+        for train_epoch_info in train_info:
+            writer.write({**train_epoch_info, **more_info})
+        print(f"{len(train_info)} training epoches output to {self.outfile}")
+        # val
+        for val_epoch_info in val_info:
+            more = {
+                **val_epoch_info,
+                **self.parse_any_info(any_info),
+                **more_info,
+            }
+            writer.write(more)
+        print(f"{len(val_info)} validation output to {self.outfile}")
+
+    def run(self, any_info: List[str], extra_metrics: bool = False):
         train_files = self.find_csv_files(self.indir, prefix="train_epoch")
         val_files = self.find_csv_files(self.indir, prefix="val_epoch")
+        train_info = self.convert_batch(train_files, "train", extra_metrics)
+        val_info = self.convert_batch(val_files, "val", extra_metrics)
         # to jsonline
-        with open(self.outfile, "w") as OUT:  # write both train and val to one file
-            # train
-            train_info = self.convert(train_files, "train")
-            for train_epoch_info in train_info:
-                print(json.dumps(train_epoch_info), file=OUT)
-            print(f"{len(train_info)} training epoches output to {self.outfile}")
-            # val
-            val_info = self.convert(val_files, "val")
-            for val_epoch_info in val_info:
-                more = {
-                    **val_epoch_info,
-                    **self.parse_any_info(any_info),
-                }
-                print(json.dumps(more), file=OUT)
-            print(f"{len(val_info)} validation output to {self.outfile}")
+        # write both train and val to one file
+        with open_output(self.outfile) as OUT, JsonlineWriter(OUT) as writer:
+            self.write(writer, train_info, val_info, any_info)
+
+
+class ConfusionMatrixFolders:
+    """`ConfusionMatrix` for every folder in a folder list (see `CombinedPlotter`)
+
+    All csv files of all folders are read by a thread pool (it is I/O bound),
+    output is either one `<json file name>.cf_jsonline` in outdir for every folder
+    (same as `step2.nf`), or one combined jsonline with the json file name as `name`
+    """
+
+    def __init__(self, infile: str, outfile: str):
+        self.infile = infile
+        self.outfile = outfile
+
+    def outfiles(self) -> List[str]:
+        """outputs without `combined`"""
+        return [
+            str(Path(self.outfile) / f"{Path(json_file).name}.cf_jsonline")
+            for _, json_file in parse_folder_list(self.infile)
+        ]
+
+    @PROFILER.profiled("confusion_matrix_folders")
+    def run(
+        self,
+        any_info: List[str],
+        combined: bool = False,
+        threads: int = 16,
+        extra_metrics: bool = False,
+    ) -> None:
+        folder_info = parse_folder_list(self.infile)
+        PROFILER.count("folders", len(folder_info))
+        if not combined:
+            Path(self.outfile).mkdir(parents=True, exist_ok=True)
+        with futures.ThreadPoolExecutor(threads) as executor:
+
+            def find(folder: str) -> Tuple[Dict[int, str], Dict[int, str]]:
+                matrix = ConfusionMatrix(folder, "")
+                return (
+                    matrix.find_csv_files(folder, prefix="train_epoch"),
+                    matrix.find_csv_files(folder, prefix="val_epoch"),
+                )
+
+            all_files = list(executor.map(find, [folder for folder, _ in folder_info]))
+            # submit all csv files first, to keep the disks busy
+            all_matrices = [
+                (
+                    executor.map(ConfusionMatrix.read_matrix, train_files.values()),
+                    executor.map(ConfusionMatrix.read_matrix, val_files.values()),
+                )
+                for train_files, val_files in all_files
+            ]
+            with ExitStack() as stack:
+                if combined:
+                    OUT = stack.enter_context(open_output(self.outfile))
+                    combined_writer = stack.enter_context(JsonlineWriter(OUT))
+                for (
+                    (folder, json_file),
+                    (train_files, val_files),
+                    (
+                        train_matrices,
+                        val_matrices,
+                    ),
+                ) in zip(folder_info, all_files, all_matrices):
+                    name = Path(json_file).name
+                    if combined:
+                        outfile = self.outfile
+                    else:
+                        outfile = str(Path(self.outfile) / f"{name}.cf_jsonline")
+                    matrix = ConfusionMatrix(folder, outfile)
+                    train_info = matrix.calculate_batch(
+                        list(train_files), list(train_matrices), "train", extra_metrics
+                    )
+                    val_info = matrix.calculate_batch(
+                        list(val_files), list(val_matrices), "val", extra_metrics
+                    )
+                    if combined:
+                        matrix.write(
+                            combined_writer,
+                            train_info,
+                            val_info,
+                            any_info,
+                            {"name": name},
+                        )
+                    else:
+                        with open_output(outfile) as OUT, JsonlineWriter(OUT) as writer:
+                            matrix.write(writer, train_info, val_info, any_info)
+
+
+class ConfusionMatrixFinder:
+    """Write a folder list (see `CombinedPlotter`) of the run folders in root
+
+    Run folders are the folders in root whose names match pattern, e.g.
+    config.10.20220208_220626.json, the json file of a run is
+    <json dir>/<run folder name> of the first json dir that has it.
+    Run folders are walked breadth first, the folders of one depth of all runs
+    are scanned by a thread pool (it is I/O bound, e.g. on a network mount).
+    The walk of a run stops at the first depth with a confusion matrix folder,
+    and a confusion matrix folder is not walked into.
+    """
+
+    missing_json_actions = ("keep", "skip", "fail")
+
+    def __init__(self, root: str, outfile: str):
+        self.root = os.path.abspath(root)
+        self.outfile = outfile
+
+    @staticmethod
+    def scan(folder: str, name: str) -> Tuple[List[str], List[str]]:
+        """(folders named name, other folders) in folder"""
+        found, subdirs = [], []
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if not entry.is_dir():
+                            continue
+                        if entry.name == name:
+                            found.append(entry.path)
+                        elif not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            # e.g. no permission, like Path.rglob
+            pass
+        return found, subdirs
+
+    def find_matrix_folders(
+        self, runs: List[str], name: str, executor: futures.Executor
+    ) -> Dict[str, str]:
+        """run folder => its confusion matrix folder (the first one by path)"""
+        res = {}
+        frontiers = {run: [run] for run in runs}
+        while frontiers:
+            # submit all folders of this depth first
+            jobs = {
+                run: executor.map(self.scan, folders, [name] * len(folders))
+                for run, folders in frontiers.items()
+            }
+            next_frontiers = {}
+            for run, results in jobs.items():
+                found, subdirs = [], []
+                for some_found, some_subdirs in results:
+                    found.extend(some_found)
+                    subdirs.extend(some_subdirs)
+                if found:
+                    res[run] = min(found)
+                elif subdirs:
+                    next_frontiers[run] = subdirs
+            frontiers = next_frontiers
+        return res
+
+    @PROFILER.profiled("find_confusion_matrix_folders")
+    def run(
+        self,
+        pattern: str,
+        json_dirs: List[str],
+        name: str = "confuse_matrix",
+        threads: int = 16,
+        missing_json: str = "keep",
+        include: List[str] = [],
+        exclude: List[str] = [],
+    ) -> int:
+        """return the number of lines written
+
+        missing_json: keep (the path in the first json dir), skip or fail
+        include/exclude: regexes of json files, a json file should match any of
+        include (if given) and none of exclude
+        """
+        if missing_json not in self.missing_json_actions:
+            raise ValueError(
+                f"Unknown action({missing_json}), choose from {self.missing_json_actions}"
+            )
+        pat = re.compile(pattern)
+        json_dirs = json_dirs or [os.path.join(self.root, "json_output")]
+        runs = []
+        with os.scandir(self.root) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            if pat.match(entry.name) and entry.is_dir():
+                runs.append(entry.path)
+            else:
+                # the folder list can be stdout
+                print(f"skip {entry.path}", file=sys.stderr)
+        PROFILER.count("folders", len(runs))
+        with futures.ThreadPoolExecutor(threads) as executor:
+            # json files are checked while the run folders are walked
+            json_checks = {
+                run: [
+                    (json_file, executor.submit(os.path.isfile, json_file))
+                    for json_file in (
+                        os.path.join(json_dir, Path(run).name) for json_dir in json_dirs
+                    )
+                ]
+                for run in runs
+            }
+            matrix_folders = self.find_matrix_folders(runs, name, executor)
+            n = 0
+            with open_output(self.outfile) as OUT:
+                for run in runs:
+                    if run not in matrix_folders:
+                        # don't fail, only warn
+                        print(f"Cannot find {name} folder in {run}", file=sys.stderr)
+                        continue
+                    checks = json_checks[run]
+                    json_file = next(
+                        (json_file for json_file, job in checks if job.result()), None
+                    )
+                    if json_file is None:
+                        print(
+                            f"Cannot find json file for folder: {run}", file=sys.stderr
+                        )
+                        if missing_json == "fail":
+                            raise FileNotFoundError(
+                                f"json file of {run} is not in {json_dirs}"
+                            )
+                        if missing_json == "skip":
+                            continue
+                        json_file = checks[0][0]
+                    if include and not any(re.search(p, json_file) for p in include):
+                        continue
+                    if any(re.search(p, json_file) for p in exclude):
+                        continue
+                    print(f"{matrix_folders[run]}\t{json_file}", file=OUT)
+                    n += 1
+        return n
+
+
+# downsampling before plotting
+DOWNSAMPLE_METHODS = ("minmax", "mean", "lttb")
+
+
+def downsample_xy(
+    x: np.ndarray, y: np.ndarray, max_points: int, method: str = "minmax"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Reduce points (sorted by x) to at most about max_points
+
+    minmax: min and max y of max_points/2 buckets, keeps the spikes
+    mean: mean x and y of max_points buckets, like a rolling mean
+    lttb: largest triangle three buckets, see https://github.com/sveinn-steinarsson/flot-downsample
+    """
+    n = len(x)
+    if max_points <= 0 or n <= max_points:
+        return x, y
+    order = np.argsort(x, kind="stable")
+    x, y = x[order], y[order]
+    if method == "minmax":
+        buckets = max(max_points // 2, 1)
+        bucket = np.arange(n) * buckets // n
+        starts = np.searchsorted(bucket, np.arange(buckets))
+        ends = np.append(starts[1:], n)
+        # sorted by (bucket, y), so the first/last of a bucket is its min/max
+        by_y = np.lexsort((y, bucket))
+        keep = np.unique(np.concatenate([by_y[starts], by_y[ends - 1]]))
+        return x[keep], y[keep]
+    if method == "mean":
+        starts = np.arange(max_points) * n // max_points
+        counts = np.diff(np.append(starts, n))
+        x_mean = np.add.reduceat(x.astype(np.float64), starts) / counts
+        y_mean = np.add.reduceat(y.astype(np.float64), starts) / counts
+        return x_mean, y_mean
+    if method == "lttb":
+        max_points = max(max_points, 3)
+        # the first and last points are kept, others are in max_points - 2 buckets
+        edges = 1 + np.arange(max_points - 1) * (n - 2) // (max_points - 2)
+        keep = np.empty(max_points, np.int64)
+        keep[0], keep[-1] = 0, n - 1
+        a = 0
+        for i in range(max_points - 2):
+            lo, hi = edges[i], edges[i + 1]
+            if i + 2 < len(edges):
+                next_x = x[hi : edges[i + 2]].mean()
+                next_y = y[hi : edges[i + 2]].mean()
+            else:
+                next_x, next_y = x[-1], y[-1]
+            area = np.abs(
+                (x[a] - next_x) * (y[lo:hi] - y[a])
+                - (x[a] - x[lo:hi]) * (next_y - y[a])
+            )
+            a = lo + int(np.argmax(area))
+            keep[i + 1] = a
+        return x[keep], y[keep]
+    raise ValueError(f"Unknown method({method}), choose from {DOWNSAMPLE_METHODS}")
+
+
+@PROFILER.profiled("downsample")
+def downsample_frame(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    by: List[str],
+    max_points: int,
+    method: str = "minmax",
+) -> pd.DataFrame:
+    """`downsample_xy` for every group (e.g. one line of seaborn) of df
+
+    only columns x, y and by are kept, rows with NaN x or y are dropped
+    """
+    if max_points <= 0:
+        return df
+    parts = []
+    groups = (
+        df.groupby(by, dropna=False, sort=False, observed=True) if by else [((), df)]
+    )
+    for key, group in groups:
+        group = group.dropna(subset=[x, y])
+        some_x, some_y = downsample_xy(
+            group[x].to_numpy(), group[y].to_numpy(), max_points, method
+        )
+        columns: Dict[str, Any] = {x: some_x, y: some_y}
+        columns.update(zip(by, key))
+        parts.append(pd.DataFrame(columns))
+    return pd.concat(parts, ignore_index=True)
+
+
+def concat_categorical(frames: List[pd.DataFrame], columns: List[str]) -> pd.DataFrame:
+    """`pd.concat`, but categorical columns stay categorical (with all categories)"""
+    for column in columns:
+        categories = list(
+            dict.fromkeys(c for df in frames for c in df[column].cat.categories)
+        )
+        for df in frames:
+            df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(frames)
+
+
+# formats of the DataFrame dumped by `CombinedPlotter1`, none: not dumped
+DF_FORMATS = ("csv", "parquet", "feather", "npz", "none")
+DF_SUFFIXES = {
+    "csv": ".df",
+    "parquet": ".df.parquet",
+    "feather": ".df.feather",
+    "npz": ".df.npz",
+}
+
+
+@PROFILER.profiled("export_df")
+def save_combined_df(df: pd.DataFrame, outfile: str, df_format: str = "csv") -> str:
+    """dump df to outfile + a suffix of `DF_SUFFIXES`, return the path ("" for none)
+
+    csv keeps the index (`pd.read_csv(path, index_col=0)`), other formats drop it
+    and store str columns as categorical (dictionary encoded), see `load_combined_df`
+    """
+    if df_format not in DF_FORMATS:
+        raise ValueError(f"Unknown format({df_format}), choose from {DF_FORMATS}")
+    if df_format == "none":
+        return ""
+    path = outfile + DF_SUFFIXES[df_format]
+    if df_format == "csv":
+        df.to_csv(path)
+        return path
+    df = df.reset_index(drop=True)
+    for column in df.columns:
+        if not isinstance(df[column].dtype, pd.CategoricalDtype) and (
+            df[column].dtype == object or pd.api.types.is_string_dtype(df[column])
+        ):
+            # in the order of appearance, like the hue/style order of seaborn
+            df[column] = pd.Categorical(
+                df[column], categories=pd.unique(df[column].dropna())
+            )
+    if df_format == "parquet":
+        df.to_parquet(path)
+    elif df_format == "feather":
+        df.to_feather(path)
+    else:
+        # column <n>: values, or codes and categories of a categorical column
+        arrays: Dict[str, Any] = {"columns": np.array(df.columns, str)}
+        for n, column in enumerate(df.columns):
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                arrays[f"{n}.codes"] = values.cat.codes.to_numpy()
+                arrays[f"{n}.categories"] = np.array(values.cat.categories, str)
+            else:
+                arrays[str(n)] = values.to_numpy()
+        np.savez_compressed(path, **arrays)
+    return path
+
+
+def load_combined_df(path: str) -> pd.DataFrame:
+    """load a DataFrame dumped by `save_combined_df`, the format is from the suffix"""
+    if path.endswith(DF_SUFFIXES["parquet"]):
+        return pd.read_parquet(path)
+    if path.endswith(DF_SUFFIXES["feather"]):
+        return pd.read_feather(path)
+    if path.endswith(DF_SUFFIXES["npz"]):
+        columns: Dict[str, Any] = {}
+        with np.load(path, allow_pickle=False) as npz:
+            for n, column in enumerate(npz["columns"].tolist()):
+                if f"{n}.codes" in npz:
+                    columns[column] = pd.Categorical.from_codes(
+                        npz[f"{n}.codes"], categories=pd.Index(npz[f"{n}.categories"])
+                    )
+                else:
+                    columns[column] = npz[str(n)]
+        return pd.DataFrame(columns)
+    return pd.read_csv(path, index_col=0)
 
 
 class Plot:
     def __init__(self, infile: str, outfile: str):
         self.infile = infile
         self.outfile = outfile
+        # e.g. `FollowingJsonlineReader` to plot a growing file
+        self.reader = JsonlineReader(infile)
+        # set by `BatchPlotter`, so jsonlines of other plots are shared
+        self.tables: Optional[TableCache] = None
+
+    def follow(self, interval: float = 30, max_refreshes: int = 0, **kwargs):
+        """`run` again and again every `interval` seconds, for a growing infile"""
+        reader = self.reader
+        assert isinstance(reader, FollowingJsonlineReader), reader
+        n = 0
+        try:
+            while True:
+                self.run(**kwargs)
+                plt.close("all")
+                n += 1
+                print(f"refresh {n}: {reader.offset} bytes of {self.infile} read")
+                if max_refreshes and n >= max_refreshes:
+                    break
+                time.sleep(interval)
+        finally:
+            reader.save_state()
 
     def setup_seaborn(self, **kwargs):
         if "context" in kwargs:
@@ -122,6 +1328,22 @@ class Plot:
         if "figsize" in kwargs:
             sns.set(rc={"figure.figsize": glom.glom(kwargs, "figsize")})
 
+    def get_lineplot_kwargs(
+        self, ci: bool = True, estimator: Optional[str] = "mean"
+    ) -> Dict[str, Any]:
+        """turn off the confidence interval (bootstrap) and/or aggregation of sns.lineplot"""
+        kwargs: Dict[str, Any] = {}
+        if estimator != "mean":
+            # None: no aggregation, every point is drawn
+            kwargs["estimator"] = estimator
+        if not ci:
+            major, minor = sns.__version__.split(".")[:2]
+            if (int(major), int(minor)) >= (0, 12):
+                kwargs["errorbar"] = None
+            else:
+                kwargs["ci"] = None
+        return kwargs
+
     def run(
         self,
         *,
@@ -130,6 +1352,10 @@ class Plot:
         x: str = "wholestep,epoch",
         y: List[str] = ["valid", "train", "lr"],
         figsize=(12, 8),
+        max_points: int = 0,  # 0: no downsampling, see `downsample_xy`
+        downsample: str = "minmax",
+        ci: bool = True,
+        estimator: Optional[str] = "mean",
     ):
 
         self.setup_seaborn(
@@ -139,7 +1365,7 @@ class Plot:
         )
 
         # 1. filter data with y
-        good_data = JsonlineReader(self.infile).only_data_with_y(y)
+        good_data = self.reader.only_columns_with_y(y, columns=x.split(",") + ["type"])
 
         # 2. plot one by one
         if not good_data:
@@ -152,7 +1378,8 @@ class Plot:
         subplots_number = len(good_data)
         fig, axs = plt.subplots(nrows=subplots_number, squeeze=True)
         for n, (some_y, some_data) in enumerate(good_data):
-            data_df = pd.DataFrame.from_records(some_data)
+            with PROFILER.stage("dataframe"):
+                data_df = pd.DataFrame(some_data)
             x1 = [x0 for x0 in xs if x0 in data_df.columns]
             print(f"x1 is {x1}")
             if x1:
@@ -161,8 +1388,19 @@ class Plot:
                     ax = axs
                 else:
                     ax = axs[n]
-                sns.lineplot(x=x1[0], y=some_y, data=data_df, ax=ax)
-        fig.savefig(self.outfile, bbox_inches="tight")
+                data_df = downsample_frame(
+                    data_df, x1[0], some_y, [], max_points, downsample
+                )
+                with PROFILER.stage("lineplot"):
+                    sns.lineplot(
+                        x=x1[0],
+                        y=some_y,
+                        data=data_df,
+                        ax=ax,
+                        **self.get_lineplot_kwargs(ci, estimator),
+                    )
+        with PROFILER.stage("savefig"):
+            fig.savefig(self.outfile, bbox_inches="tight")
 
 
 class CombinedPlotter(Plot):
@@ -174,17 +1412,22 @@ class CombinedPlotter(Plot):
     """
 
     def parse_input(self) -> List[Tuple[str, str]]:
-        res = []
-        with open(self.infile) as IN:
-            for line in IN:
-                temp = line.strip()
-                if should_ignore(temp):
-                    continue
-                folder: str  # confusion_matrix_output_folder
-                json_file: str  # json file with information
-                folder, json_file = glom.glom(temp, lambda x: x.split("\t"))
-                res.append((folder, json_file))
-        return res
+        return parse_folder_list(self.infile)
+
+
+def parse_folder_list(infile: str) -> List[Tuple[str, str]]:
+    """see `CombinedPlotter`"""
+    res = []
+    with open_input(infile) as IN:
+        for line in IN:
+            temp = line.strip()
+            if should_ignore(temp):
+                continue
+            folder: str  # confusion_matrix_output_folder
+            json_file: str  # json file with information
+            folder, json_file = temp.split("\t")
+            res.append((folder, json_file))
+    return res
 
 
 class Plot2(Plot):
@@ -206,6 +1449,37 @@ class Plot2(Plot):
             "title_info": title_info,
         }
 
+    def melted_data(
+        self, y: List[str], xs: List[str], chunk_size: int = 0
+    ) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """(x, melted DataFrame) of records with y[0], at most one"""
+        if chunk_size > 0:
+            melted = self.reader.melt_with_y(y, xs, chunk_size)
+            if melted is not None:
+                yield str(melted.columns[0]), melted
+            return
+        y0 = y[0]
+        good_data = self.reader.only_columns_with_y([y0], columns=xs + ["type"] + y)
+
+        # 获取变量，比较方便
+        for n, (some_y, some_data) in enumerate(good_data):
+            assert n == 0
+            x1 = first_record_xs(xs, some_data)
+            print(f"x1 is {x1}")
+            xlabel = None
+            if x1:
+                ### 注意这里的x只取第一个找到的 ###
+                # only first x is used
+                xlabel = x1[0]
+            if not xlabel:
+                raise ValueError(f"No x({xs}) is found in file({self.infile})")
+            select_columns = ["type", xlabel] + y
+            with PROFILER.stage("dataframe"):
+                data_df = pd.DataFrame(some_data, columns=select_columns)
+                # melt
+                df2 = pd.melt(data_df, [xlabel, "type"])
+            yield xlabel, df2
+
     @parsed_any_info
     def run(
         self,
@@ -217,6 +1491,11 @@ class Plot2(Plot):
         figsize=(12, 8),
         title_info: Dict = {},  # 这个变量是可以保存的相关信息，可以放到title里面
         title: str = "Acc",
+        max_points: int = 0,  # 0: no downsampling, see `downsample_xy`
+        downsample: str = "minmax",
+        ci: bool = True,
+        estimator: Optional[str] = "mean",
+        chunk_size: int = 0,  # >0: build the DataFrame chunk by chunk, see `melt_with_y`
     ):
         self.setup_seaborn(
             context=context,
@@ -228,33 +1507,20 @@ class Plot2(Plot):
         print(f"xs is {xs}")
 
         # 1. 获取数据，这里只取第一个y，因为这些y都是需要的
-        y0 = y[0]
-        good_data = JsonlineReader(self.infile).only_data_with_y([y0])
-
-        # 获取变量，比较方便
-        for n, (some_y, some_data) in enumerate(good_data):
-            assert n == 0
-            x1 = [x0 for x0 in xs if x0 in glom.glom(some_data, glom.T[0])]
-            print(f"x1 is {x1}")
-            xlabel = None
-            if x1:
-                ### 注意这里的x只取第一个找到的 ###
-                # only first x is used
-                xlabel = x1[0]
-            if not xlabel:
-                raise ValueError(f"No x({xs}) is found in file({self.infile})")
-            select_columns = ["type", xlabel] + y
-            data_df = pd.DataFrame.from_records(some_data, columns=select_columns)
-            # melt
-            df2 = pd.melt(data_df, [xlabel, "type"])
-            sns_plot = sns.lineplot(
-                x=xlabel,
-                y="value",
-                hue="variable",
-                data=df2,
-                style="type",
-                palette=palette,
+        for xlabel, df2 in self.melted_data(y, xs, chunk_size):
+            df2 = downsample_frame(
+                df2, xlabel, "value", ["variable", "type"], max_points, downsample
             )
+            with PROFILER.stage("lineplot"):
+                sns_plot = sns.lineplot(
+                    x=xlabel,
+                    y="value",
+                    hue="variable",
+                    data=df2,
+                    style="type",
+                    palette=palette,
+                    **self.get_lineplot_kwargs(ci, estimator),
+                )
             if title_info:
                 title1 = title + self.get_title_info(title_info)
             else:
@@ -262,7 +1528,8 @@ class Plot2(Plot):
             sns_plot.set_title(title1)
             fig = sns_plot.get_figure()
             if self.outfile:
-                fig.savefig(self.outfile, bbox_inches="tight")
+                with PROFILER.stage("savefig"):
+                    fig.savefig(self.outfile, bbox_inches="tight")
             else:
                 return {
                     "data": df2,
@@ -271,29 +1538,667 @@ class Plot2(Plot):
 
 
 class JsonlineReader:
-    def __init__(self, infile: str):
+    # use a columnar cache (see `ColumnTable.save`) next to the jsonline
+    use_cache = False
+    # use an index (see `LineIndex`) next to the jsonline, to decode only the needed lines
+    use_index = False
+
+    def __init__(
+        self,
+        infile: str,
+        cache: Optional[bool] = None,
+        tables: Optional[TableCache] = None,
+        index: Optional[bool] = None,
+    ):
         self.infile = infile
+        self.cache = self.use_cache if cache is None else cache
+        self.index = self.use_index if index is None else index
+        # shared with other readers, see `TableCache`
+        self.tables = tables
+
+    @property
+    def cache_dir(self) -> str:
+        return self.infile + ".columns"
+
+    def source_info(self) -> Dict[str, Any]:
+        """the cache is rebuilt if any of these changed"""
+        stat = os.stat(self.infile)
+        return {
+            "path": os.path.abspath(self.infile),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    @PROFILER.profiled("read.cache")
+    def load_table(self) -> ColumnTable:
+        """all columns of infile, from the cache if it is up to date"""
+        source = self.source_info()
+        try:
+            table = ColumnTable.load(self.cache_dir)
+        except (OSError, ValueError, KeyError):
+            pass
+        else:
+            if table.source == source:
+                return table
+        table = ColumnTable.from_records(self.iter_parsed())
+        table.source = source
+        try:
+            table.save(self.cache_dir)
+        except OSError as e:
+            print(f"Cannot write cache({self.cache_dir}): {e}")
+        return table
+
+    def iter_parsed(self) -> Iterator[Dict]:
+        with open_input(self.infile) as IN:
+            yield from parse_jsonlines(IN)
+
+    @property
+    def index_file(self) -> str:
+        return self.infile + ".idx.npz"
+
+    @PROFILER.profiled("read.index")
+    def load_index(self) -> LineIndex:
+        """`LineIndex` of infile, rebuilt if it is out of date"""
+        source = self.source_info()
+        try:
+            index = LineIndex.load(self.index_file)
+        except (OSError, ValueError, KeyError):
+            pass
+        else:
+            if index.source == source:
+                return index
+        index = LineIndex.build(self.infile)
+        index.source = source
+        try:
+            index.save(self.index_file)
+        except OSError as e:
+            print(f"Cannot write index({self.index_file}): {e}")
+        return index
+
+    def iter_parsed_with(self, keys: List[str]) -> Iterator[Dict]:
+        """records with at least one of keys, only these lines are decoded with the index"""
+        if self.index and self.infile != "-" and not detect_compression(self.infile):
+            index = self.load_index()
+            yield from index.read_rows(self.infile, index.rows_with_any(keys))
+            return
+        for parsed in self.iter_parsed():
+            if any(key in parsed for key in keys):
+                yield parsed
 
     def filter_data_with_y(self, y: str) -> Iterator[Dict]:
-        with open(self.infile) as IN:
-            for line in IN:
-                temp = line.strip()
-                if should_ignore(temp):
-                    continue
-                parsed: Dict = json.loads(temp)
-                if y in parsed:
-                    yield parsed
+        yield from self.iter_parsed_with([y])
 
+    @PROFILER.profiled("read.records")
     def only_data_with_y(self, y: List[str]):
         # now finish this
-        # 1. parse data
+        # 1. parse data, only once for all y
+        #    (the same dict is shared if it has more than one y)
+        all_data: Dict[str, List[Dict]] = {some_y: [] for some_y in y}
+        for parsed in self.iter_parsed_with(y):
+            for some_y in y:
+                if some_y in parsed:
+                    all_data[some_y].append(parsed)
         good_data: List[Tuple[str, List[Dict]]] = []
         for some_y in y:
-            some_data = list(self.filter_data_with_y(some_y))
+            some_data = all_data[some_y]
             if some_data:
                 good_data.append((some_y, some_data))
         return good_data
 
+    @PROFILER.profiled("read.columns")
+    def only_columns_with_y(
+        self, y: List[str], columns: List[str]
+    ) -> List[Tuple[str, Columns]]:
+        """Same as `only_data_with_y`, but in one scan build columns instead of dicts
+
+        Only `columns` and `y` are kept, e.g. columns=["wholestep", "epoch", "type"].
+        A column is only returned if at least one record (with that y) has it,
+        records without it get None.
+        So `pd.DataFrame(some_columns)` equals to `pd.DataFrame.from_records(some_data)`
+        with only these columns.
+        """
+        if self.tables is not None and self.infile != "-":
+            return self.tables.get(self).query(y, columns)
+        if self.cache and self.infile != "-":
+            return self.load_table().query(y, columns)
+        wanted: List[str] = list(dict.fromkeys([*columns, *y]))
+        all_columns: Dict[str, Columns] = {some_y: {} for some_y in y}
+        sizes: Dict[str, int] = {some_y: 0 for some_y in y}
+        self.collect_columns(self.iter_parsed_with(y), wanted, all_columns, sizes)
+        good_data: List[Tuple[str, Columns]] = []
+        for some_y in y:
+            if sizes[some_y]:
+                good_data.append((some_y, all_columns[some_y]))
+        return good_data
+
+    @staticmethod
+    def typed_array(values: List[Any], dtype: Any) -> np.ndarray:
+        """values as dtype (None => NaN), or as objects if some are not numbers"""
+        try:
+            return np.array(values, dtype)
+        except (TypeError, ValueError):
+            return np.array(values, object)
+
+    @staticmethod
+    def concat_typed(parts: List[np.ndarray]) -> np.ndarray:
+        """np.concatenate, numbers and other values are concatenated as objects"""
+        kinds = {part.dtype.kind for part in parts}
+        if len(kinds) > 1 and not kinds <= set("biuf"):
+            parts = [part.astype(object) for part in parts]
+        return np.concatenate(parts)
+
+    @PROFILER.profiled("read.melt")
+    def melt_with_y(
+        self, y: List[str], xs: List[str], chunk_size: int = 1 << 16
+    ) -> Optional[pd.DataFrame]:
+        """Same as `pd.melt` of the columns of records with y[0] (see `Plot2.run`),
+        but records are read chunk by chunk into typed arrays, without the wide DataFrame
+
+        columns: <x>, type, variable, value (in this order, variable by variable)
+        x: the first of xs found (in the first record), int64 (float64 if missing
+            in some records, object if some are not numbers)
+        type, variable: categorical
+        value: float32 (object if some are not numbers)
+        None if no record has y[0]
+        """
+        x_parts: List[np.ndarray] = []
+        xlabel = ""
+        type_codes: Dict[Any, int] = {}
+        code_parts: List[np.ndarray] = []
+        value_parts: Dict[str, List[np.ndarray]] = {some_y: [] for some_y in y}
+        records = self.iter_parsed_with(y[:1])
+        while True:
+            chunk = [parsed for _, parsed in zip(range(chunk_size), records)]
+            if not chunk:
+                break
+            if not xlabel:
+                # keys of the first record, like `Plot2.run`
+                x1 = [x0 for x0 in xs if x0 in chunk[0]]
+                print(f"x1 is {x1}")
+                if not x1:
+                    raise ValueError(f"No x({xs}) is found in file({self.infile})")
+                ### 注意这里的x只取第一个找到的 ###
+                xlabel = x1[0]
+            values = [parsed.get(xlabel) for parsed in chunk]
+            array1 = np.array(values)
+            if array1.dtype == object:
+                # None => NaN, other values (e.g. strings) stay objects like pd.melt
+                array1 = self.typed_array(values, np.float64)
+            x_parts.append(array1)
+            chunk_codes = (
+                -1 if t is None else type_codes.setdefault(t, len(type_codes))
+                for t in (parsed.get("type") for parsed in chunk)
+            )
+            code_parts.append(np.fromiter(chunk_codes, np.int32, len(chunk)))
+            for some_y in y:
+                values = [parsed.get(some_y) for parsed in chunk]
+                value_parts[some_y].append(self.typed_array(values, np.float32))
+        if not code_parts:
+            return None
+        x_values = self.concat_typed(x_parts)
+        codes = np.concatenate(code_parts)
+        n = len(codes)
+        return pd.DataFrame(
+            {
+                xlabel: np.tile(x_values, len(y)),
+                "type": pd.Categorical.from_codes(
+                    np.tile(codes, len(y)), categories=pd.Index(list(type_codes))
+                ),
+                "variable": pd.Categorical.from_codes(
+                    np.repeat(np.arange(len(y)), n), categories=pd.Index(y)
+                ),
+                "value": self.concat_typed(
+                    [array1 for some_y in y for array1 in value_parts[some_y]]
+                ),
+            }
+        )
+
+    @staticmethod
+    def collect_columns(
+        records: Iterable[Dict],
+        wanted: List[str],
+        all_columns: Dict[str, Columns],
+        sizes: Dict[str, int],
+    ) -> None:
+        """append wanted columns of records to all_columns[y] for every y they have"""
+        for parsed in records:
+            for some_y in all_columns:
+                if some_y not in parsed:
+                    continue
+                some_columns = all_columns[some_y]
+                size = sizes[some_y]
+                for key in wanted:
+                    if key in parsed:
+                        if key not in some_columns:
+                            some_columns[key] = [None] * size
+                        some_columns[key].append(parsed[key])
+                    elif key in some_columns:
+                        some_columns[key].append(None)
+                sizes[some_y] = size + 1
+
+
+class FollowingJsonlineReader(JsonlineReader):
+    """`only_columns_with_y` of a growing jsonline, e.g. a log of a running training
+
+    Columns of the last call are kept with the byte offset of infile,
+    the next call only decodes lines appended after that offset
+    (a partial last line is left for the next call).
+    It starts from scratch if infile is truncated/replaced or the query is changed.
+    The state can be saved to (and loaded from) `state_file`.
+    """
+
+    def __init__(self, infile: str, state_file: Optional[str] = None):
+        super().__init__(infile, cache=False, index=False)
+        self.state_file = state_file
+        self.reset()
+        if state_file and os.path.isfile(state_file):
+            with open(state_file, "rb") as IN:
+                state = pickle.load(IN)
+            if state.get("infile") == os.path.abspath(infile):
+                self.__dict__.update(state["reader"])
+
+    def reset(self, query: Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]] = None):
+        """query: (y, columns) of `only_columns_with_y`"""
+        self.query = query
+        self.inode: Optional[int] = None
+        self.offset = 0
+        y = query[0] if query else ()
+        self.all_columns: Dict[str, Columns] = {some_y: {} for some_y in y}
+        self.sizes: Dict[str, int] = {some_y: 0 for some_y in y}
+
+    def save_state(self) -> None:
+        if not self.state_file:
+            return
+        reader = {
+            k: getattr(self, k)
+            for k in ["query", "inode", "offset", "all_columns", "sizes"]
+        }
+        state = {"infile": os.path.abspath(self.infile), "reader": reader}
+        with open(self.state_file, "wb") as OUT:
+            pickle.dump(state, OUT)
+
+    def read_new_lines(self) -> List[str]:
+        stat = os.stat(self.infile)
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            # a new file
+            self.reset(self.query)
+            self.inode = stat.st_ino
+        with open(self.infile, "rb") as IN:
+            IN.seek(self.offset)
+            data = IN.read()
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        return data[:end].decode().split("\n")
+
+    def only_columns_with_y(
+        self, y: List[str], columns: List[str]
+    ) -> List[Tuple[str, Columns]]:
+        query = (tuple(y), tuple(columns))
+        if query != self.query:
+            self.reset(query)
+        wanted: List[str] = list(dict.fromkeys([*columns, *y]))
+        records = parse_jsonlines(self.read_new_lines())
+        self.collect_columns(records, wanted, self.all_columns, self.sizes)
+        good_data: List[Tuple[str, Columns]] = []
+        for some_y in y:
+            if self.sizes[some_y]:
+                good_data.append((some_y, self.all_columns[some_y]))
+        return good_data
+
+
+class ColumnTable:
+    """All columns of a jsonline as numpy arrays, one row per record
+
+    values[column]: int64/float64/str array, other values (e.g. dict) are dumped to json str
+    present[column]: bool array, if the record has the column
+    nulls[column]: bool array, if the value is null, only for columns with a null value
+    kinds[column]: one of "int", "float", "str", "json"
+    source: where the table is from, see `JsonlineReader.source_info`
+    """
+
+    # version of the format written by `save`
+    version = 2
+
+    def __init__(
+        self,
+        values: Dict[str, np.ndarray],
+        present: Dict[str, np.ndarray],
+        kinds: Dict[str, str],
+        source: Optional[Dict[str, Any]] = None,
+        nulls: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        self.values = values
+        self.present = present
+        self.kinds = kinds
+        self.source = source
+        self.nulls = nulls or {}
+
+    def __len__(self) -> int:
+        for column in self.present.values():
+            return len(column)
+        return 0
+
+    @staticmethod
+    def to_array(
+        values: List[Any], missing: Any = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, str]:
+        """(values, present, nulls, kind), missing: the value of a missing key"""
+        present = np.fromiter((v is not missing for v in values), bool, len(values))
+        if missing is not None:
+            values = [None if v is missing else v for v in values]
+        nulls = np.fromiter((v is None for v in values), bool, len(values)) & present
+        types = {type(v) for v in values if v is not None}
+        try:
+            if types <= {int}:
+                ints = [0 if v is None else v for v in values]
+                return np.array(ints, np.int64), present, nulls, "int"
+            if types <= {int, float}:
+                return np.array(values, np.float64), present, nulls, "float"
+        except OverflowError:
+            pass
+        if types <= {str}:
+            strs = ["" if v is None else v for v in values]
+            return np.array(strs, str), present, nulls, "str"
+        dumped = ["" if v is None else JSON.dumps(v) for v in values]
+        return np.array(dumped, str), present, nulls, "json"
+
+    @classmethod
+    def from_columns(cls, columns: Columns, missing: Any = None) -> "ColumnTable":
+        """missing: the value of a missing key, by default a None is missing"""
+        values, present, kinds, nulls = {}, {}, {}, {}
+        for name, column in columns.items():
+            values[name], present[name], null, kinds[name] = cls.to_array(
+                column, missing
+            )
+            if null.any():
+                nulls[name] = null
+        return cls(values, present, kinds, nulls=nulls)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> "ColumnTable":
+        # a null value is not a missing key, like `JsonlineReader.only_columns_with_y`
+        return cls.from_columns(records_to_columns(records, MISSING), MISSING)
+
+    def to_columns(self, rows=None, columns: Iterable[str] = ()) -> Columns:
+        """columns (all by default) of some rows (all by default), None if not present"""
+        res: Columns = {}
+        for name in columns or self.values:
+            if name not in self.values:
+                continue
+            values = self.values[name]
+            present = self.present[name]
+            if name in self.nulls:
+                present = present & ~self.nulls[name]
+            if rows is not None:
+                values, present = values[rows], present[rows]
+            some_values = values.tolist()
+            if self.kinds[name] == "json":
+                some_values = [JSON.loads(v) if v else None for v in some_values]
+            if not present.all():
+                some_values = [
+                    v if p else None for v, p in zip(some_values, present.tolist())
+                ]
+            res[name] = some_values
+        return res
+
+    def save_npz(self, outfile: str) -> None:
+        arrays: Dict[str, Any] = dict(self.values)
+        for name, present in self.present.items():
+            if not present.all():
+                arrays[f"{name}:present"] = present
+        for name, null in self.nulls.items():
+            arrays[f"{name}:null"] = null
+        arrays["__kinds__"] = np.array(JSON.dumps(self.kinds))
+        # np.savez adds `.npz` to the filename, unless it is a file object
+        with open(outfile, "wb") as OUT:
+            np.savez_compressed(OUT, **arrays)
+
+    @classmethod
+    def load_npz(cls, infile: str) -> "ColumnTable":
+        with np.load(infile) as loaded:
+            kinds = JSON.loads(str(loaded["__kinds__"]))
+            values = {name: loaded[name] for name in kinds}
+            present = {
+                name: (
+                    loaded[f"{name}:present"]
+                    if f"{name}:present" in loaded
+                    else np.ones(len(values[name]), bool)
+                )
+                for name in kinds
+            }
+            nulls = {
+                name: loaded[f"{name}:null"]
+                for name in kinds
+                if f"{name}:null" in loaded
+            }
+        return cls(values, present, kinds, nulls=nulls)
+
+    def query(self, y: List[str], columns: List[str]) -> List[Tuple[str, Columns]]:
+        """Same as `JsonlineReader.only_columns_with_y`"""
+        wanted: List[str] = list(dict.fromkeys([*columns, *y]))
+        good_data: List[Tuple[str, Columns]] = []
+        for some_y in y:
+            if some_y not in self.present:
+                continue
+            rows = np.flatnonzero(self.present[some_y])
+            if not len(rows):
+                continue
+            names = [
+                name
+                for name in wanted
+                if name in self.present and self.present[name][rows].any()
+            ]
+            good_data.append((some_y, self.to_columns(rows, names)))
+        return good_data
+
+    def save(self, outdir: str) -> None:
+        """one .npy file per column (and its presence), so they can be memory-mapped"""
+        tmpdir = f"{outdir}.tmp{os.getpid()}"
+        os.makedirs(tmpdir, exist_ok=True)
+        columns = []
+        for n, (name, values) in enumerate(self.values.items()):
+            column = {"name": name, "kind": self.kinds[name], "values": f"{n}.npy"}
+            np.save(os.path.join(tmpdir, column["values"]), values)
+            if not self.present[name].all():
+                column["present"] = f"{n}.present.npy"
+                np.save(os.path.join(tmpdir, column["present"]), self.present[name])
+            if name in self.nulls:
+                column["null"] = f"{n}.null.npy"
+                np.save(os.path.join(tmpdir, column["null"]), self.nulls[name])
+            columns.append(column)
+        meta = {
+            "version": self.version,
+            "source": self.source,
+            "rows": len(self),
+            "columns": columns,
+        }
+        with open(os.path.join(tmpdir, "meta.json"), "w") as OUT:
+            json.dump(meta, OUT)
+        if os.path.isdir(outdir):
+            shutil.rmtree(outdir)
+        os.replace(tmpdir, outdir)
+
+    @classmethod
+    def load(cls, indir: str) -> "ColumnTable":
+        with open(os.path.join(indir, "meta.json")) as IN:
+            meta = json.load(IN)
+        if meta["version"] != cls.version:
+            raise ValueError(f"Unknown version of {indir}: {meta['version']}")
+        values, present, kinds, nulls = {}, {}, {}, {}
+        for column in meta["columns"]:
+            name = column["name"]
+            kinds[name] = column["kind"]
+            values[name] = np.load(os.path.join(indir, column["values"]), mmap_mode="r")
+            if "present" in column:
+                present[name] = np.load(
+                    os.path.join(indir, column["present"]), mmap_mode="r"
+                )
+            else:
+                present[name] = np.ones(meta["rows"], bool)
+            if "null" in column:
+                nulls[name] = np.load(
+                    os.path.join(indir, column["null"]), mmap_mode="r"
+                )
+        return cls(values, present, kinds, source=meta["source"], nulls=nulls)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            v.nbytes
+            for arrays in (self.values, self.present, self.nulls)
+            for v in arrays.values()
+        )
+
+
+class TableCache:
+    """ColumnTables of jsonlines shared by many plots, e.g. in `BatchPlotter`
+
+    A table is keyed by the absolute path, and reloaded if the size/mtime changed.
+    If max_bytes > 0, the least recently used tables are dropped above it.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.tables: Dict[str, ColumnTable] = {}
+
+    def get(self, reader: "JsonlineReader") -> ColumnTable:
+        source = reader.source_info()
+        key = source["path"]
+        table = self.tables.pop(key, None)
+        if table is None or table.source != source:
+            if reader.cache:
+                table = reader.load_table()
+            else:
+                table = ColumnTable.from_records(reader.iter_parsed())
+                table.source = source
+        # the last one is the most recently used
+        self.tables[key] = table
+        if self.max_bytes > 0:
+            total = sum(t.nbytes for t in self.tables.values())
+            for old_key in list(self.tables):
+                if total <= self.max_bytes or old_key == key:
+                    break
+                total -= self.tables.pop(old_key).nbytes
+        return table
+
+
+class LineIndex:
+    """Byte offsets of the records of a jsonline, and which keys every record has
+
+    offsets/lengths: where the line of every record is (comments/empty lines excluded)
+    keys: all keys of the top level of records
+    bits[n]: presence of keys[n] in every record, packed by `np.packbits`
+    source: where the index is from, see `JsonlineReader.source_info`
+    """
+
+    def __init__(
+        self,
+        offsets: np.ndarray,
+        lengths: np.ndarray,
+        keys: List[str],
+        bits: np.ndarray,
+        source: Optional[Dict[str, Any]] = None,
+    ):
+        self.offsets = offsets
+        self.lengths = lengths
+        self.keys = keys
+        self.bits = bits
+        self.source = source
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, infile: str) -> "LineIndex":
+        offsets = array("q")
+        lengths = array("q")
+        # key => rows with the key
+        key_rows: Dict[str, array] = {}
+        offset = 0
+        with open(infile, "rb", buffering=IO_BUFFER_SIZE) as IN:
+            for line in IN:
+                temp = line.strip()
+                if temp and not temp.startswith(b"#"):
+                    row = len(offsets)
+                    for key in JSON.loads(temp):
+                        if key not in key_rows:
+                            key_rows[key] = array("q")
+                        key_rows[key].append(row)
+                    offsets.append(offset)
+                    lengths.append(len(line))
+                offset += len(line)
+        presence = np.zeros((len(key_rows), len(offsets)), bool)
+        for n, rows in enumerate(key_rows.values()):
+            presence[n, np.frombuffer(rows, np.int64)] = True
+        return cls(
+            np.frombuffer(offsets, np.int64),
+            np.frombuffer(lengths, np.int64),
+            list(key_rows),
+            np.packbits(presence, axis=1),
+        )
+
+    def rows_with_any(self, keys: List[str]) -> np.ndarray:
+        """rows (in order) of records with at least one of keys"""
+        bits = np.zeros(self.bits.shape[1], np.uint8)
+        for n, key in enumerate(self.keys):
+            if key in keys:
+                bits |= self.bits[n]
+        return np.flatnonzero(np.unpackbits(bits, count=len(self)))
+
+    def read_rows(self, infile: str, rows: np.ndarray) -> Iterator[Dict]:
+        if not len(rows):
+            return
+        with open(infile, "rb") as IN, mmap.mmap(
+            IN.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            for offset, length in zip(
+                self.offsets[rows].tolist(), self.lengths[rows].tolist()
+            ):
+                yield JSON.loads(data[offset : offset + length])
+
+    def save(self, outfile: str) -> None:
+        tmpfile = f"{outfile}.tmp{os.getpid()}.npz"
+        np.savez(
+            tmpfile,
+            offsets=self.offsets,
+            lengths=self.lengths,
+            keys=np.array(self.keys, str),
+            bits=self.bits,
+            source=np.array(json.dumps(self.source)),
+        )
+        os.replace(tmpfile, outfile)
+
+    @classmethod
+    def load(cls, infile: str) -> "LineIndex":
+        with np.load(infile, allow_pickle=False) as npz:
+            return cls(
+                npz["offsets"],
+                npz["lengths"],
+                npz["keys"].tolist(),
+                npz["bits"],
+                source=json.loads(str(npz["source"])),
+            )
+
+
+# a missing key of `records_to_columns`, to tell it from a null value
+MISSING = object()
+
+
+def records_to_columns(records: Iterable[Dict], missing: Any = None) -> Columns:
+    """list of dicts => dict of lists, `missing` (None by default) for missing keys"""
+    columns: Columns = {}
+    size = 0
+    for record in records:
+        for key, value in record.items():
+            if key not in columns:
+                columns[key] = [missing] * size
+            columns[key].append(value)
+        size += 1
+        for column in columns.values():
+            if len(column) < size:
+                column.append(missing)
+    return columns
+
 
 class CombinedPlotter1(CombinedPlotter):
     def get_title_info(self, title_info: Dict, **kwargs) -> str:
@@ -311,7 +2216,7 @@ class CombinedPlotter1(CombinedPlotter):
         #     spec = (lambda x: pat.match(x), glom.T.groupdict(), "base")
         #     return glom.glom(Path(filename).name, spec)
         all_lines = []
-        with open(any_info) as IN:
+        with open_input(any_info) as IN:
             for line in IN:
                 temp = line.strip()
                 if should_ignore(temp):
@@ -323,10 +2228,12 @@ class CombinedPlotter1(CombinedPlotter):
         # 字典的key为config_json_basename
         subset_json_info: Dict[str, Dict] = {}
         jsonline_info: Dict[str, str] = {}
+        # every file is read once, it can be an index of subset-json-batch
+        loaded: Dict[str, Dict] = {}
         for config_json_base_name, subset_json_fullpath, jsonline_fullpath in all_lines:
-            with open(subset_json_fullpath) as IN:
-                subset_info = json.load(IN)
-            subset_json_info[config_json_base_name] = subset_info
+            subset_json_info[config_json_base_name] = load_subset_info(
+                subset_json_fullpath, config_json_base_name, loaded
+            )
             jsonline_info[config_json_base_name] = jsonline_fullpath
         title = "Acc"
         title_info = subset_json_info
@@ -337,6 +2244,140 @@ class CombinedPlotter1(CombinedPlotter):
             "jsonline_info": jsonline_info,
         }
 
+    def to_df(
+        self,
+        config_json_base_name: str,
+        jsonline_file: str,
+        xs: List[str],
+        y: List[str],
+        chunk_size: int = 0,
+    ) -> pd.DataFrame:
+        y0 = y[0]
+        reader = JsonlineReader(jsonline_file, tables=self.tables)
+        if chunk_size > 0:
+            df2 = reader.melt_with_y(y, xs, chunk_size)
+            if df2 is None:
+                raise NotImplementedError("cannot get here")
+            df2["name"] = pd.Categorical.from_codes(
+                np.zeros(len(df2), np.int8),
+                categories=pd.Index([config_json_base_name]),
+            )
+            return df2
+        good_data = reader.only_columns_with_y([y0], columns=xs + ["type"] + y)
+        for n, (some_y, some_data) in enumerate(good_data):
+            assert n == 0
+            x1 = first_record_xs(xs, some_data)
+            print(f"x1 is {x1}")
+            xlabel = None
+            if x1:
+                ### 注意这里的x只取第一个找到的 ###
+                # only first x is used
+                xlabel = x1[0]
+            if not xlabel:
+                raise ValueError(f"No x({xs}) is found in file({self.infile})")
+            select_columns = ["type", xlabel] + y
+            data_df = pd.DataFrame(some_data, columns=select_columns)
+            # melt
+            df2 = pd.melt(data_df, [xlabel, "type"])
+            df2["name"] = config_json_base_name
+            return df2
+        raise NotImplementedError("cannot get here")
+
+    @PROFILER.profiled("dataframe")
+    def build_combined_df(
+        self,
+        jsonline_info: Dict[str, str],
+        xs: List[str],
+        y: List[str],
+        workers: int = 0,
+        chunk_size: int = 0,
+    ) -> pd.DataFrame:
+        """`to_df` of every config, concatenated"""
+        if workers > 1:
+            # 每个jsonline在单独的进程里读取
+            with futures.ProcessPoolExecutor(workers) as executor:
+                jsonline_to_df = list(
+                    executor.map(
+                        self.to_df,
+                        jsonline_info.keys(),
+                        jsonline_info.values(),
+                        [xs] * len(jsonline_info),
+                        [y] * len(jsonline_info),
+                        [chunk_size] * len(jsonline_info),
+                    )
+                )
+        else:
+            jsonline_to_df = glom.glom(
+                jsonline_info.items(),
+                ([lambda item: self.to_df(item[0], item[1], xs, y, chunk_size)],),
+            )
+
+        if chunk_size > 0:
+            combined_df = concat_categorical(
+                jsonline_to_df, ["type", "variable", "name"]
+            )
+            names = combined_df["name"].cat.categories
+            combined_df["name"] = combined_df["name"].cat.reorder_categories(
+                sorted(names)
+            )
+        else:
+            combined_df = pd.concat(jsonline_to_df)
+        return combined_df
+
+    @staticmethod
+    @PROFILER.profiled("lineplot")
+    def draw_panel(
+        ax,
+        sub_df: pd.DataFrame,
+        title: str,
+        xlimits,
+        ylimits,
+        lineplot_kwargs: Dict[str, Any],
+    ):
+        sns_plot = sns.lineplot(
+            x="epoch",
+            y="value",
+            hue="variable",
+            data=sub_df,
+            style="type",
+            palette="husl",
+            ax=ax,
+            **lineplot_kwargs,
+        )
+        sns_plot.set_title(title)
+        if xlimits:
+            sns_plot.set_xlim(xlimits[0], xlimits[1])
+        if ylimits:
+            sns_plot.set_ylim(ylimits[0], ylimits[1])
+
+    @staticmethod
+    def render_panel(
+        sub_df: pd.DataFrame,
+        title: str,
+        panel_size: Tuple[float, float],
+        dpi: float,
+        context: str,
+        palette: str,
+        xlimits,
+        ylimits,
+        lineplot_kwargs: Dict[str, Any],
+    ) -> bytes:
+        """draw one panel in a worker process, return it as png"""
+        import matplotlib
+
+        matplotlib.use("Agg")
+        sns.set_context(context)
+        sns.set_palette(palette)
+        fig, ax = plt.subplots(figsize=panel_size, dpi=dpi)
+        CombinedPlotter1.draw_panel(
+            ax, sub_df, title, xlimits, ylimits, lineplot_kwargs
+        )
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=dpi)
+        plt.close(fig)
+        return buf.getvalue()
+
     @parsed_any_info
     def run(
         self,
@@ -353,6 +2394,14 @@ class CombinedPlotter1(CombinedPlotter):
         xlimits=None,
         ylimits=None,
         title_wrap_width=70,
+        max_points: int = 0,  # 0: no downsampling, see `downsample_xy`
+        downsample: str = "minmax",
+        ci: bool = True,
+        estimator: Optional[str] = "mean",
+        workers: int = 0,  # >1: read the jsonlines in a process pool
+        panel_workers: int = 0,  # >1: render every panel in a process pool
+        chunk_size: int = 0,  # >0: build DataFrames chunk by chunk, see `melt_with_y`
+        df_format: str = "csv",  # see `save_combined_df`
         # jsonnet config sns
     ):
 
@@ -374,109 +2423,509 @@ class CombinedPlotter1(CombinedPlotter):
         xs: List[str] = x.split(",")
         print(f"xs is {xs}")
 
-        def to_df(config_json_base_name: str, jsonline_file: str) -> pd.DataFrame:
-            y0 = y[0]
-            good_data = JsonlineReader(jsonline_file).only_data_with_y([y0])
-            for n, (some_y, some_data) in enumerate(good_data):
-                assert n == 0
-                x1 = [x0 for x0 in xs if x0 in glom.glom(some_data, glom.T[0])]
-                print(f"x1 is {x1}")
-                xlabel = None
-                if x1:
-                    ### 注意这里的x只取第一个找到的 ###
-                    # only first x is used
-                    xlabel = x1[0]
-                if not xlabel:
-                    raise ValueError(f"No x({xs}) is found in file({self.infile})")
-                select_columns = ["type", xlabel] + y
-                data_df = pd.DataFrame.from_records(some_data, columns=select_columns)
-                # melt
-                df2 = pd.melt(data_df, [xlabel, "type"])
-                df2["name"] = config_json_base_name
-                return df2
-            raise NotImplementedError("cannot get here")
-
-        jsonline_to_df = glom.glom(
-            jsonline_info.items(),
-            ([lambda item: to_df(item[0], item[1])],),
-        )
-
-        combined_df = pd.concat(jsonline_to_df)
-        combined_df.to_csv(self.outfile + ".df")
+        PROFILER.count("configs", len(jsonline_info))
+        combined_df = self.build_combined_df(jsonline_info, xs, y, workers, chunk_size)
+        save_combined_df(combined_df, self.outfile, df_format)
 
         # real plot
-        fig, axes = plt.subplots(nrows=plot_grid[0], ncols=plot_grid[1], squeeze=True)
-        axes = axes.flatten()
-        for n, name in enumerate(sorted(combined_df.name.unique())):
-            sub_df = combined_df[combined_df.name == name]
-            sns_plot = sns.lineplot(
-                x="epoch",
-                y="value",
-                hue="variable",
-                data=sub_df,
-                style="type",
-                palette="husl",
-                ax=axes[n],
+        lineplot_kwargs = self.get_lineplot_kwargs(ci, estimator)
+        panels = []
+        # one pass over combined_df, instead of a boolean scan per name
+        for name, sub_df in combined_df.groupby("name", sort=True, observed=True):
+            sub_df = downsample_frame(
+                sub_df, "epoch", "value", ["variable", "type"], max_points, downsample
             )
-            title_info1 = title_info[name]
+            title_info1 = title_info[str(name)]
+            title1 = title
             if title_info1:
                 title1 = title + self.get_title_info(title_info1, width=title_wrap_width)
-            sns_plot.set_title(title1)
-            if xlimits:
-                sns_plot.set_xlim(xlimits[0], xlimits[1])
-            if ylimits:
-                sns_plot.set_ylim(ylimits[0], ylimits[1])
-        fig.savefig(self.outfile)
+            panels.append((sub_df, title1))
+
+        if panel_workers > 1:
+            fig, axes = plt.subplots(
+                nrows=plot_grid[0],
+                ncols=plot_grid[1],
+                squeeze=True,
+                gridspec_kw={"wspace": 0, "hspace": 0},
+            )
+            fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
+            axes = axes.flatten()
+            width, height = fig.get_size_inches()
+            panel_size = (width / plot_grid[1], height / plot_grid[0])
+            with PROFILER.stage("panels"), futures.ProcessPoolExecutor(
+                panel_workers
+            ) as executor:
+                images = executor.map(
+                    self.render_panel,
+                    *zip(*panels),
+                    [panel_size] * len(panels),
+                    [fig.dpi] * len(panels),
+                    [context] * len(panels),
+                    [palette] * len(panels),
+                    [xlimits] * len(panels),
+                    [ylimits] * len(panels),
+                    [lineplot_kwargs] * len(panels),
+                )
+                for ax, image in zip(axes, images):
+                    ax.imshow(plt.imread(io.BytesIO(image)), aspect="auto")
+            for ax in axes:
+                ax.set_axis_off()
+        else:
+            fig, axes = plt.subplots(
+                nrows=plot_grid[0], ncols=plot_grid[1], squeeze=True
+            )
+            axes = axes.flatten()
+            for n, (sub_df, title1) in enumerate(panels):
+                self.draw_panel(
+                    axes[n], sub_df, title1, xlimits, ylimits, lineplot_kwargs
+                )
+        with PROFILER.stage("savefig"):
+            fig.savefig(self.outfile)
+
+
+def plot_from_config(
+    json_config: Dict[str, Any], any_info: str = "", tables: Optional[TableCache] = None
+):
+    """the config of plot-jsonline2, "any_info" in it overrides the any_info argument"""
+
+    def j(spec):
+        return glom.glom(json_config, spec)
+
+    Plot_class = globals()[j("class_name")]
+    any_info = json_config.get("any_info", any_info)
+    kwargs = {}
+    if any_info:
+        kwargs = {"any_info": any_info}
+    run_kwargs = {**j("sns"), **kwargs}
+
+    def render():
+        plot = Plot_class(j("infile"), j("outfile"))
+        if tables is not None:
+            plot.tables = tables
+            plot.reader = JsonlineReader(plot.infile, tables=tables)
+        return plot.run(**run_kwargs)
+
+    return memoized_plot(Plot_class, j("infile"), j("outfile"), run_kwargs, render)
+
+
+def plot_memo_args(
+    Plot_class: type, infile: str, outfile: str, run_kwargs: Dict[str, Any]
+) -> Tuple[Dict[str, Any], List[Tuple[str, str]], List[str]]:
+    """params, inputs and outputs of a plot for `MemoStore.run`"""
+    params = dict(run_kwargs)
+    any_info = params.pop("any_info", "")
+    # the same outputs with any number of processes
+    params.pop("workers", None)
+    params.pop("panel_workers", None)
+    combined = issubclass(Plot_class, CombinedPlotter)
+    # folders of a folder list are read through the jsonlines of any_info
+    inputs = [("list" if combined else "path", infile)]
+    if any_info:
+        inputs.append(("list" if combined else "path", any_info))
+    outputs = [outfile]
+    df_format = params.get("df_format", "csv")
+    if issubclass(Plot_class, CombinedPlotter1) and df_format != "none":
+        outputs.append(outfile + DF_SUFFIXES[df_format])
+    return {"class_name": Plot_class.__name__, **params}, inputs, outputs
+
+
+def memoized_plot(
+    Plot_class: type,
+    infile: str,
+    outfile: str,
+    run_kwargs: Dict[str, Any],
+    render: Callable[[], Any],
+) -> Any:
+    """render() by `MEMO`"""
+    params, inputs, outputs = plot_memo_args(Plot_class, infile, outfile, run_kwargs)
+    return MEMO.run("plot", params, inputs, outputs, render)
+
+
+class BatchPlotter:
+    """Render many plot-jsonline2 configs in one process (or a few)
+
+    configs: config json files, folders of them (*.json) or lists of them (one per line)
+    Configs with the same infile are rendered by the same worker, one by one,
+    so the jsonlines are only parsed once, see `TableCache`.
+    """
+
+    def __init__(self, configs: List[str]):
+        self.config_files = self.find_configs(configs)
+
+    @staticmethod
+    def find_configs(configs: List[str]) -> List[str]:
+        res = []
+        for config in configs:
+            if os.path.isdir(config):
+                res.extend(sorted(glob.glob(os.path.join(config, "*.json"))))
+            elif config.endswith(".json"):
+                res.append(config)
+            else:
+                with open(config) as IN:
+                    for line in IN:
+                        temp = line.strip()
+                        if should_ignore(temp):
+                            continue
+                        res.append(temp)
+        return res
+
+    @staticmethod
+    def render_group(
+        config_files: List[str], any_info: str, max_bytes: int
+    ) -> List[Tuple[str, Optional[str]]]:
+        """render configs one by one, return (config file, error or None)"""
+        import matplotlib
+
+        matplotlib.use("Agg")
+        tables = TableCache(max_bytes)
+        res: List[Tuple[str, Optional[str]]] = []
+        for config_file in config_files:
+            try:
+                with open(config_file) as IN:
+                    json_config = json.load(IN)
+                plot_from_config(json_config, any_info, tables)
+            except Exception as e:
+                res.append((config_file, f"{type(e).__name__}: {e}"))
+            else:
+                res.append((config_file, None))
+            finally:
+                # Plot2 draws on the current figure
+                plt.close("all")
+        return res
+
+    def run(self, any_info: str = "", workers: int = 0, max_bytes: int = 0) -> int:
+        """return the number of failed configs"""
+        # group by infile
+        groups: Dict[str, List[str]] = {}
+        # configs which cannot be read, reported like the failed ones of `render_group`
+        unread: List[Tuple[str, Optional[str]]] = []
+        for config_file in self.config_files:
+            try:
+                with open(config_file) as IN:
+                    infile = json.load(IN).get("infile", "")
+            except Exception as e:
+                unread.append((config_file, f"{type(e).__name__}: {e}"))
+                continue
+            groups.setdefault(os.path.abspath(infile), []).append(config_file)
+        if workers > 1:
+            with futures.ProcessPoolExecutor(workers) as executor:
+                jobs = [
+                    executor.submit(self.render_group, group, any_info, max_bytes)
+                    for group in groups.values()
+                ]
+                results = [job.result() for job in jobs]
+        else:
+            # one cache for all groups, e.g. jsonlines of CombinedPlotter1
+            results = [
+                self.render_group(
+                    [c for group in groups.values() for c in group],
+                    any_info,
+                    max_bytes,
+                )
+            ]
+        failed = 0
+        results.append(unread)
+        for config_file, error in (item for result in results for item in result):
+            if error:
+                failed += 1
+                print(f"Failed to plot {config_file}: {error}")
+        print(f"{len(self.config_files) - failed}/{len(self.config_files)} plotted")
+        return failed
+
+
+class PlotServer:
+    """`serve`: render plot-jsonline2 configs on request, for notebooks and dashboards
+
+    POST /plot?format=png|svg with a plot-jsonline2 config as the json body
+    ("outfile" is not needed), the response is the image, 400 for a bad config
+    and 404 if an input file is missing.
+    GET /stats: cached images, hits and misses.
+
+    Every worker process keeps the parsed jsonlines in a `TableCache` (at most
+    max_bytes each, reloaded when the size/mtime of a jsonline changes), configs
+    with the same infile always go to the same worker. Rendered images are kept
+    too (at most max_image_bytes), by the config and size/mtime of its inputs
+    (see `plot_memo_args`), so a repeated view is not rendered again.
+    """
+
+    formats = {"png": "image/png", "svg": "image/svg+xml"}
+    # TableCache of a worker process
+    tables: Optional[TableCache] = None
+
+    def __init__(
+        self,
+        any_info: str = "",
+        workers: int = 0,
+        max_bytes: int = 0,
+        max_image_bytes: int = 0,
+    ):
+        self.any_info = any_info
+        self.max_bytes = max_bytes
+        self.max_image_bytes = max_image_bytes
+        # one process per executor, so a worker keeps its jsonlines
+        self.executors = [
+            futures.ProcessPoolExecutor(1)
+            for _ in range(workers or os.cpu_count() or 1)
+        ]
+        self.fingerprints = MemoStore(digest="stat")
+        # the last one is the most recently used
+        self.images: Dict[str, bytes] = {}
+        self.pending: Dict[str, futures.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        import threading
+
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def render(json_config: Dict[str, Any], any_info: str, max_bytes: int) -> bytes:
+        """in a worker process, json_config["outfile"] is a temporary file"""
+        import matplotlib
+
+        matplotlib.use("Agg")
+        if PlotServer.tables is None:
+            PlotServer.tables = TableCache(max_bytes)
+        outfile = json_config["outfile"]
+        try:
+            plot_from_config(json_config, any_info, PlotServer.tables)
+            with open(outfile, "rb") as IN:
+                return IN.read()
+        except FileNotFoundError:
+            raise ValueError("Nothing is plotted, see the log of the server")
+        finally:
+            plt.close("all")
+            for path in glob.glob(outfile + "*"):
+                os.remove(path)
+
+    def plot(
+        self, json_config: Dict[str, Any], image_format: str
+    ) -> Tuple[bytes, bool]:
+        """(image, cached)"""
+        if image_format not in self.formats:
+            raise ValueError(
+                f"Unknown format({image_format}), choose from {list(self.formats)}"
+            )
+        Plot_class = globals()[json_config["class_name"]]
+        infile = json_config["infile"]
+        fd, outfile = tempfile.mkstemp(suffix=f".{image_format}")
+        os.close(fd)
+        os.remove(outfile)
+        sns_config = dict(json_config.get("sns", {}))
+        if issubclass(Plot_class, CombinedPlotter1):
+            # only the image is needed
+            sns_config.setdefault("df_format", "none")
+        json_config = {**json_config, "outfile": outfile, "sns": sns_config}
+        any_info = json_config.get("any_info", self.any_info)
+        params, inputs, _ = plot_memo_args(
+            Plot_class,
+            infile,
+            outfile,
+            {**sns_config, "any_info": any_info} if any_info else sns_config,
+        )
+        # a bad request, not a fault of the server
+        for _, path in inputs:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No such file: {path}")
+        key = self.fingerprints.key(f"serve.{image_format}", params, inputs)
+        with self.lock:
+            image = self.images.pop(key, None)
+            if image is not None:
+                self.images[key] = image
+                self.hits += 1
+                return image, True
+            job = self.pending.get(key)
+            if job is None:
+                self.misses += 1
+                executor = self.executors[
+                    hash(os.path.abspath(infile)) % len(self.executors)
+                ]
+                job = executor.submit(
+                    self.render, json_config, self.any_info, self.max_bytes
+                )
+                self.pending[key] = job
+        try:
+            image = job.result()
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        with self.lock:
+            self.images[key] = image
+            if self.max_image_bytes > 0:
+                total = sum(len(i) for i in self.images.values())
+                for old_key in list(self.images):
+                    if total <= self.max_image_bytes or old_key == key:
+                        break
+                    total -= len(self.images.pop(old_key))
+        return image, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "images": len(self.images),
+                "image_bytes": sum(len(i) for i in self.images.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "workers": len(self.executors),
+            }
+
+    def serve(
+        self, host: str = "127.0.0.1", port: int = 8765, socket_path: str = ""
+    ) -> None:
+        """serve until interrupted, on a unix socket if socket_path"""
+        import signal
+        import socketserver
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import parse_qs, urlparse
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def address_string(self):
+                # client_address of a unix socket is ""
+                return (
+                    str(self.client_address[0]) if self.client_address else socket_path
+                )
+
+            def reply(
+                self, code: int, content_type: str, body: bytes, **headers
+            ) -> None:
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if urlparse(self.path).path == "/stats":
+                    self.reply(
+                        200, "application/json", json.dumps(server.stats()).encode()
+                    )
+                else:
+                    self.reply(404, "text/plain", b"GET /stats or POST /plot\n")
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != "/plot":
+                    self.reply(404, "text/plain", b"POST /plot\n")
+                    return
+                image_format = parse_qs(url.query).get("format", ["png"])[0]
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    json_config = json.loads(self.rfile.read(length))
+                    image, cached = server.plot(json_config, image_format)
+                except (ValueError, KeyError, TypeError) as e:
+                    self.reply(400, "text/plain", f"{type(e).__name__}: {e}\n".encode())
+                except FileNotFoundError as e:
+                    # e.g. infile, or a jsonline of a folder list
+                    self.reply(404, "text/plain", f"{type(e).__name__}: {e}\n".encode())
+                except Exception as e:
+                    self.reply(500, "text/plain", f"{type(e).__name__}: {e}\n".encode())
+                else:
+                    self.reply(
+                        200,
+                        server.formats[image_format],
+                        image,
+                        **{"X-Cache": "hit" if cached else "miss"},
+                    )
+
+        # start the workers before the threads of the server, they are forked
+        for executor in self.executors:
+            executor.submit(os.getpid).result()
+        httpd: socketserver.TCPServer
+        if socket_path:
+
+            class UnixHTTPServer(
+                socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+            ):
+                daemon_threads = True
+
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            httpd = UnixHTTPServer(socket_path, Handler)
+            print(f"serving on {socket_path}")
+        else:
+            httpd = ThreadingHTTPServer((host, port), Handler)
+            print(f"serving on http://{host}:{httpd.server_address[1]}")
+        # e.g. `kill`, SIGINT is ignored by background jobs
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+            for executor in self.executors:
+                executor.shutdown(cancel_futures=True)
+            if socket_path and os.path.exists(socket_path):
+                os.remove(socket_path)
 
 
 class TemporaryConverter:
+
     def __init__(self, infile: str, outfile: str):
         self.infile = infile
         self.outfile = outfile
+        self.key_cache: Dict[str, Optional[Tuple[str, int]]] = {}
+
+    # e.g. epoch292 => ("epoch", 292)
+    key_pattern = re.compile(r"(\D+)(\d+)")
+    # cached keys are at most this number, e.g. epoch0-epoch999 and step0-step9999
+    max_cached_keys = 100_000
+
+    def split_key(self, key: str) -> Optional[Tuple[str, int]]:
+        """`key_pattern` with a cache, None if not matched"""
+        try:
+            return self.key_cache[key]
+        except KeyError:
+            pass
+        m = self.key_pattern.match(key)
+        split = (m.group(1), int(m.group(2))) if m else None
+        if len(self.key_cache) >= self.max_cached_keys:
+            self.key_cache.clear()
+        self.key_cache[key] = split
+        return split
 
     def convert_old_formats(self, obj: Dict) -> Dict:
         # log_9.txt => {"epoch1": {"step0": {"train": 1.7113, "lr": 0.01}}}
         # log_100.txt => {"epoch2": {"valid": 1.0219}}
         # log.txt => 1. {"epoch292": {"step1715": {}, "valid": 0.8156}}
         #            2. {"epoch0": {"step0": {"train": 1.2284, "lr": 0.01}}}
-        pat = re.compile("(\D+)(\d+)")
-
-        def get_number_from_key(d: Dict) -> List[Tuple[str, int]]:
-            """Just a flatten function
-
-            Args:
-                d (Dict): [description]
-
-            Returns:
-                List[Tuple[str, int]]: [description]
-            """
-            res = []
-            for key, value in d.items():
-                m = pat.match(key)
-                if m:
-                    column, value2 = m.groups()
-                    res.append((column, int(value2)))
+        # Just a flatten function, without recursion:
+        #   key matched: e.g. epoch1 => "epoch": 1, then flatten its value if it is a dict
+        #   key not matched: flatten its value if it is a dict, then key => value
+        res: Dict = {}
+        split_key = self.split_key
+        # (items to flatten, key and value to set after all these items)
+        stack: List[Tuple[Iterator, Optional[Tuple[str, Any]]]] = [
+            (iter(obj.items()), None)
+        ]
+        while stack:
+            for key, value in stack[-1][0]:
+                split = split_key(key)
+                if split is not None:
+                    res[split[0]] = split[1]
                 if isinstance(value, dict):
-                    # only recursive here
-                    res.extend(get_number_from_key(value))
-                if not m:
-                    res.append((key, value))
-            return res
-
-        res = dict(get_number_from_key(obj))
+                    stack.append((iter(value.items()), None if split else (key, value)))
+                    break
+                if split is None:
+                    res[key] = value
+            else:
+                _, after = stack.pop()
+                if after is not None:
+                    res[after[0]] = after[1]
         return res
 
+    @PROFILER.profiled("normalize")
     def run(self):
         """就是将几种模式的“不标准”，变成后续能够读入pandas的“简单”jsonline格式"""
-        with open(self.infile) as IN, open(self.outfile, "w") as OUT:
-            for line in IN:
-                temp = line.strip()
-                if temp.startswith("#") or not temp:
-                    continue
-                # jsonline
-                parsed = json.loads(temp)
+        with open_input(self.infile) as IN, open_output(
+            self.outfile
+        ) as OUT, JsonlineWriter(OUT) as writer:
+            for parsed in parse_jsonlines(IN):
                 new_format = self.convert_old_formats(parsed)
-                print(json.dumps(new_format), file=OUT)
+                writer.write(new_format)
 
 
 class Transformer:
@@ -492,30 +2941,323 @@ class Transformer:
             )
         return obj
 
-    def run(self):
+    def rescue_stream(self, records: Iterable[Dict]) -> Iterator[str]:
+        """Only one pass over records, yield dumped lines after the last record is read"""
+        with RescueSpool() as spool:
+            for obj in records:
+                spool.add(obj)
+            yield from spool
+
+    def run_streaming(self):
+        """Same output as `run`, but read infile only once, so it can be stdin"""
+        with open_input(self.infile) as IN, open_output(
+            self.outfile
+        ) as OUT, JsonlineWriter(OUT) as writer:
+            for line in self.rescue_stream(parse_jsonlines(IN)):
+                writer.write_line(line)
+
+    @PROFILER.profiled("rescue")
+    def run(self, streaming: bool = False):
         """就是将几种模式的“不标准”，变成后续能够读入pandas的“简单”jsonline格式"""
+        if streaming or self.infile == "-":
+            return self.run_streaming()
+
         max_step = -1
 
         # 1st iteration, calculate max_step
-        with open(self.infile) as IN:
-            for line in IN:
-                temp = line.strip()
-                if should_ignore(temp):
-                    continue
-                parsed = json.loads(temp)
+        with open_input(self.infile) as IN:
+            for parsed in parse_jsonlines(IN):
                 if "step" in parsed:
                     max_step = max(parsed["step"], max_step)
 
         # 2nd iteration
-        with open(self.infile) as IN, open(self.outfile, "w") as OUT:
-            for line in IN:
-                temp = line.strip()
-                if should_ignore(temp):
-                    continue
-                # jsonline
-                parsed = json.loads(temp)
+        with open_input(self.infile) as IN, open_output(
+            self.outfile
+        ) as OUT, JsonlineWriter(OUT) as writer:
+            for parsed in parse_jsonlines(IN):
                 new_format = self.rescue(parsed, max_step)
-                print(json.dumps(new_format), file=OUT)
+                writer.write(new_format)
+
+
+class RescueSpool:
+    """Keep dumped records until max_step is known, then add `wholestep` to them
+    (same as `Transformer.rescue`) without parsing them again
+
+    records are spilled to a temporary file if they are bigger than `max_size`
+    (or written to `spool` if it is given), `epoch`/`step` of each record are kept
+    in compact arrays
+    """
+
+    def __init__(self, max_size: int = 64 << 20, spool: Optional[IO[str]] = None):
+        self.spool: IO[str] = spool or tempfile.SpooledTemporaryFile(
+            max_size=max_size, mode="w+"
+        )
+        self.max_step = -1
+        # 1 if the record has both step and epoch
+        self.has_step = array("b")
+        self.epochs = array("q")
+        self.steps = array("q")
+        # index of has_step => (epoch, step), which are not int
+        self.others: Dict[int, Tuple[Any, Any]] = {}
+        # indexes of has_step of records which are dumped again with wholestep:
+        # they already have a wholestep, or their separators are not
+        # `JSON.item_separator` (written by stdlib with a compact backend)
+        self.redumps: Set[int] = set()
+
+    def add(self, obj: Dict) -> None:
+        if "step" in obj:
+            self.max_step = max(obj["step"], self.max_step)
+        line = JSON.dumps_compact(obj)
+        if "step" in obj and "epoch" in obj:
+            # kept as it is, like `Transformer.rescue` with max_step <= 0
+            if "wholestep" in obj or (JSON.compact and line is None):
+                self.redumps.add(len(self.has_step))
+            epoch, step = obj["epoch"], obj["step"]
+            if type(epoch) is int and type(step) is int:
+                self.epochs.append(epoch)
+                self.steps.append(step)
+            else:
+                self.others[len(self.has_step)] = (epoch, step)
+                if JSON.compact:
+                    # wholestep can be NaN
+                    self.redumps.add(len(self.has_step))
+            self.has_step.append(1)
+        else:
+            self.has_step.append(0)
+        self.spool.write(json.dumps(obj) if line is None else line)
+        self.spool.write("\n")
+
+    def __iter__(self) -> Iterator[str]:
+        return self.lines(self.max_step)
+
+    def lines(self, max_step: int) -> Iterator[str]:
+        """dumped lines with wholestep, max_step can be from more than one spool"""
+        separator = JSON.item_separator
+        self.spool.seek(0)
+        n_step = 0
+        for n, line in enumerate(self.spool):
+            line = line.rstrip("\n")
+            if self.has_step[n]:
+                if n in self.others:
+                    epoch, step = self.others[n]
+                else:
+                    epoch, step = self.epochs[n_step], self.steps[n_step]
+                    n_step += 1
+                if max_step > 0 and n in self.redumps:
+                    # e.g. replaced in place, same as `Transformer.rescue`
+                    obj = JSON.loads(line)
+                    obj["wholestep"] = epoch * max_step + step
+                    line = JSON.dumps(obj)
+                elif max_step > 0:
+                    wholestep = JSON.dumps({"wholestep": epoch * max_step + step})
+                    line = line[:-1] + separator + wholestep[1:]
+            yield line
+
+    def __enter__(self) -> "RescueSpool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.spool.close()
+
+    def __getstate__(self) -> Dict:
+        # to return it from a subprocess, the spool file itself is not sent
+        return {**self.__dict__, "spool": None}
+
+
+class NormalizeRescue:
+    """`normalize-old-formats` and `rescue-normalized-file` in one process
+
+    `TemporaryConverter.convert_old_formats` and `Transformer.rescue` are chained as
+    generators, so every line is parsed and dumped only once and only outfile is written
+    """
+
+    formats = ("jsonline", "npz", "parquet")
+
+    def __init__(self, infile: str, outfile: str):
+        self.infile = infile
+        self.outfile = outfile
+
+    def iter_records(self, IN: Iterable[str]) -> Iterator[Dict]:
+        converter = TemporaryConverter(self.infile, self.outfile)
+        for parsed in parse_jsonlines(IN):
+            yield converter.convert_old_formats(parsed)
+
+    def rescue_columns(self, columns: Columns) -> Columns:
+        """`Transformer.rescue` over columns"""
+        epochs = columns.get("epoch")
+        steps = columns.get("step")
+        if epochs is None or steps is None:
+            return columns
+        max_step = max((step for step in steps if step is not None), default=-1)
+        if max_step <= 0:
+            return columns
+        wholesteps = columns.get("wholestep", [None] * len(steps))
+        columns["wholestep"] = [
+            epoch * max_step + step if epoch is not None and step is not None else old
+            for epoch, step, old in zip(epochs, steps, wholesteps)
+        ]
+        return columns
+
+    @PROFILER.profiled("normalize_rescue")
+    def run(self, out_format: str = "jsonline"):
+        if out_format not in self.formats:
+            raise ValueError(
+                f"Unknown format({out_format}), choose from {self.formats}"
+            )
+        with open_input(self.infile) as IN:
+            records = self.iter_records(IN)
+            if out_format == "jsonline":
+                transformer = Transformer(self.infile, self.outfile)
+                with open_output(self.outfile) as OUT, JsonlineWriter(OUT) as writer:
+                    for line in transformer.rescue_stream(records):
+                        writer.write_line(line)
+                return
+            columns = self.rescue_columns(records_to_columns(records))
+        if out_format == "npz":
+            ColumnTable.from_columns(columns).save_npz(self.outfile)
+        elif out_format == "parquet":
+            # needs pyarrow or fastparquet
+            pd.DataFrame(columns).to_parquet(self.outfile)
+
+
+class BatchNormalizeRescue:
+    """`normalize-and-rescue` for many files with a process pool
+
+    Every file is split into byte ranges (on newline boundaries) of about `chunk_size`,
+    each range is normalized in a subprocess into a spool file,
+    then `wholestep` is added with max_step of the whole file.
+    Outputs are the same as running `normalize-and-rescue` one file after another.
+    """
+
+    def __init__(
+        self,
+        infiles: List[str],
+        outdir: Optional[str] = None,
+        suffix: str = ".rescued",
+    ):
+        self.infiles = infiles
+        self.outdir = outdir
+        self.suffix = suffix
+
+    def get_outfile(self, infile: str) -> str:
+        outdir = Path(self.outdir) if self.outdir else Path(infile).parent
+        return str(outdir / (Path(infile).name + self.suffix))
+
+    @staticmethod
+    def split_file(infile: str, chunk_size: int) -> List[Tuple[int, int]]:
+        """byte ranges [start, end) of infile, every range ends with a whole line
+
+        a compressed infile is only one range
+        """
+        size = os.path.getsize(infile)
+        if detect_compression(infile):
+            return [(0, size)]
+        bounds = [0]
+        with open(infile, "rb") as IN:
+            while bounds[-1] + chunk_size < size:
+                IN.seek(bounds[-1] + chunk_size)
+                IN.readline()
+                if IN.tell() >= size:
+                    break
+                bounds.append(IN.tell())
+        bounds.append(size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    @staticmethod
+    def normalize_chunk(
+        infile: str, start: int, end: int, spool_file: str
+    ) -> RescueSpool:
+        pipeline = NormalizeRescue(infile, spool_file)
+        with ExitStack() as stack:
+            lines: Iterable[str]
+            if detect_compression(infile):
+                lines = stack.enter_context(open_input(infile))
+            else:
+                with open(infile, "rb") as IN:
+                    IN.seek(start)
+                    lines = IN.read(end - start).decode().split("\n")
+            SPOOL = stack.enter_context(open(spool_file, "w", buffering=IO_BUFFER_SIZE))
+            spool = RescueSpool(spool=SPOOL)
+            for obj in pipeline.iter_records(lines):
+                spool.add(obj)
+        return spool
+
+    @PROFILER.profiled("normalize_rescue_batch")
+    def run(self, workers: int = 0, chunk_size: int = 64 << 20) -> List[str]:
+        workers = workers or os.cpu_count() or 1
+        if self.outdir:
+            Path(self.outdir).mkdir(parents=True, exist_ok=True)
+        outfiles = []
+        with tempfile.TemporaryDirectory() as tmpdir, futures.ProcessPoolExecutor(
+            workers
+        ) as executor:
+            # submit all chunks of all files first
+            all_chunks = []
+            for n, infile in enumerate(self.infiles):
+                chunks = []
+                for m, (start, end) in enumerate(self.split_file(infile, chunk_size)):
+                    spool_file = str(Path(tmpdir) / f"{n}.{m}.jsonline")
+                    future = executor.submit(
+                        self.normalize_chunk, infile, start, end, spool_file
+                    )
+                    chunks.append((spool_file, future))
+                all_chunks.append((infile, chunks))
+            # then write outputs in order
+            for infile, chunks in all_chunks:
+                spools = [
+                    (spool_file, future.result()) for spool_file, future in chunks
+                ]
+                max_step = max(spool.max_step for _, spool in spools)
+                outfile = self.get_outfile(infile)
+                with open_output(outfile) as OUT, JsonlineWriter(OUT) as writer:
+                    for spool_file, spool in spools:
+                        with open(spool_file, buffering=IO_BUFFER_SIZE) as SPOOL:
+                            spool.spool = SPOOL
+                            for line in spool.lines(max_step):
+                                writer.write_line(line)
+                        os.remove(spool_file)
+                print(f"{infile} => {outfile}")
+                outfiles.append(outfile)
+        return outfiles
+
+
+# e.g. optimizer_name, model.layers.0.name
+SIMPLE_SPEC = re.compile(r"[A-Za-z0-9_-]+(\.[A-Za-z0-9_-]+)*")
+
+
+def compile_spec(spec: str) -> Callable[[Any], Any]:
+    """a fast accessor for a dotted glom spec (keys of dicts, indexes of lists)
+
+    glom.glom(target, spec) is used for other specs, and if the accessor fails,
+    so errors are the same as glom
+    """
+    if not SIMPLE_SPEC.fullmatch(spec):
+        return lambda target: glom.glom(target, spec)
+    parts = spec.split(".")
+
+    def accessor(target: Any) -> Any:
+        value = target
+        try:
+            for part in parts:
+                if isinstance(value, dict):
+                    value = value[part]
+                elif isinstance(value, list):
+                    value = value[int(part)]
+                else:
+                    raise TypeError(type(value))
+        except (KeyError, IndexError, TypeError, ValueError):
+            return glom.glom(target, spec)
+        return value
+
+    return accessor
+
+
+def subset_of(
+    infile: str, accessors: Dict[str, Callable[[Any], Any]]
+) -> Dict[str, Any]:
+    with open(infile) as IN:
+        parse_input = json.load(IN)
+    return {spec: accessor(parse_input) for spec, accessor in accessors.items()}
 
 
 class SubsetJson:
@@ -524,36 +3266,403 @@ class SubsetJson:
         self.outfile = outfile
 
     def run(self, specs: List[str]) -> None:
-        with open(self.infile) as IN:
-            parse_input = json.load(IN)
-        res = {}
-        for spec in specs:
-            res[spec] = glom.glom(parse_input, spec)
+        res = subset_of(self.infile, {spec: compile_spec(spec) for spec in specs})
         with open(self.outfile, "w") as OUT:
             print(json.dumps(res), file=OUT)
 
 
+# key and version of an index of subset-json-batch
+SUBSET_INDEX_FORMAT = ("subset_index_format", 1)
+
+
+class BatchSubsetJson:
+    """`SubsetJson` of many config jsons, specs are compiled once (see `compile_spec`)
+
+    outfile is one index of all configs:
+    {"subset_index_format": 1, "subset_index": {<config json name>: <subset>}},
+    the format key marks it as an index (see `load_subset_info`),
+    it can be used as the subset json of every line of a subset_json_list,
+    see `CombinedPlotter1.parse_any_info`
+    """
+
+    def __init__(self, infiles: List[str], outfile: str):
+        self.infiles = infiles
+        self.outfile = outfile
+
+    def run(
+        self, specs: List[str], threads: int = 16, outdir: Optional[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """outdir: also write <outdir>/<config json name>.subset.json like subset-json"""
+        names = [Path(infile).name for infile in self.infiles]
+        duplicated = {name for name in names if names.count(name) > 1}
+        if duplicated:
+            raise ValueError(f"config json names are not unique: {sorted(duplicated)}")
+        accessors = {spec: compile_spec(spec) for spec in specs}
+        with futures.ThreadPoolExecutor(threads) as executor:
+            subsets = list(
+                executor.map(lambda infile: subset_of(infile, accessors), self.infiles)
+            )
+        index = dict(zip(names, subsets))
+        if outdir:
+            Path(outdir).mkdir(parents=True, exist_ok=True)
+            for name, subset in index.items():
+                with open(Path(outdir) / f"{name}.subset.json", "w") as OUT:
+                    print(json.dumps(subset), file=OUT)
+        key, version = SUBSET_INDEX_FORMAT
+        with open(self.outfile, "w") as OUT:
+            print(json.dumps({key: version, "subset_index": index}), file=OUT)
+        return index
+
+
+def load_subset_info(subset_json: str, name: str, loaded: Dict[str, Dict]) -> Dict:
+    """the subset of config json `name`, subset_json is the output of subset-json or
+    the index of subset-json-batch
+
+    loaded: parsed subset_json by path, so an index is read once
+    """
+    if subset_json not in loaded:
+        with open(subset_json) as IN:
+            loaded[subset_json] = json.load(IN)
+    subset_info = loaded[subset_json]
+    key, version = SUBSET_INDEX_FORMAT
+    if key in subset_info:
+        if subset_info[key] != version:
+            raise ValueError(
+                f"Unknown {key}({subset_info[key]}) of {subset_json}, expect {version}"
+            )
+        subset_info = subset_info["subset_index"][name]
+    return subset_info
+
+
+class Aggregation:
+    """One statistic of y over records in a single pass, e.g. "max:acc"
+
+    max/min: max/min of y
+    argmax/argmin: x of the max/min (the smallest x if there is a tie)
+    last: y of the largest x
+    mean: mean of y, over the last `window` records by x if window > 0
+    Records without x or y (or y is NaN) are skipped.
+    """
+
+    names = ("max", "argmax", "min", "argmin", "last", "mean")
+
+    def __init__(self, spec: str, window: int = 0):
+        name, _, y = spec.partition(":")
+        if name not in self.names or not y:
+            raise ValueError(
+                f"Bad statistic({spec}), should be AGG:Y, AGG is one of {self.names}"
+            )
+        self.spec = spec
+        self.name = name
+        self.y = y
+        self.window = window
+        self.count = 0
+        self.best: Any = None
+        self.best_x: Any = None
+        self.total = 0.0
+        # (x, count, y) of the last `window` records, a min heap by x
+        self.heap: List[Tuple[Any, int, Any]] = []
+
+    def add(self, x: Any, value: Any) -> None:
+        if x is None or value is None or value != value:
+            return
+        self.count += 1
+        name = self.name
+        if name in ("max", "argmax"):
+            if (
+                self.best is None
+                or value > self.best
+                or (value == self.best and x < self.best_x)
+            ):
+                self.best, self.best_x = value, x
+        elif name in ("min", "argmin"):
+            if (
+                self.best is None
+                or value < self.best
+                or (value == self.best and x < self.best_x)
+            ):
+                self.best, self.best_x = value, x
+        elif name == "last":
+            if self.best_x is None or x >= self.best_x:
+                self.best, self.best_x = value, x
+        elif self.window > 0:
+            heapq.heappush(self.heap, (x, self.count, value))
+            if len(self.heap) > self.window:
+                heapq.heappop(self.heap)
+        else:
+            self.total += value
+
+    def result(self) -> Any:
+        if not self.count:
+            return None
+        if self.name in ("argmax", "argmin"):
+            return self.best_x
+        if self.name != "mean":
+            return self.best
+        if self.window > 0:
+            return sum(value for _, _, value in self.heap) / len(self.heap)
+        return self.total / self.count
+
+
+class Summary:
+    """Statistics (see `Aggregation`) of the jsonline of every config, without plotting
+
+    infile: subset_json_list (see `CombinedPlotter1.parse_any_info`),
+        or a folder list (see `CombinedPlotter`), whose jsonlines are
+        <jsonline_dir>/<json file name>.cf_jsonline (see `ConfusionMatrixFolders`)
+    outfile: tsv, one row per config, `-` for stdout
+    """
+
+    def __init__(self, infile: str, outfile: str):
+        self.infile = infile
+        self.outfile = outfile
+
+    def parse_input(self, jsonline_dir: str = "") -> List[Tuple[str, str, str]]:
+        """[(name, subset json or "", jsonline)]"""
+        res = []
+        with open_input(self.infile) as IN:
+            for line in IN:
+                temp = line.strip()
+                if should_ignore(temp):
+                    continue
+                fields = temp.split("\t")
+                if len(fields) == 3:
+                    name, subset_json, jsonline = fields
+                else:
+                    assert len(fields) == 2, fields
+                    name = Path(fields[1]).name
+                    subset_json = ""
+                    jsonline = os.path.join(jsonline_dir, f"{name}.cf_jsonline")
+                res.append((name, subset_json, jsonline))
+        return res
+
+    @staticmethod
+    @PROFILER.profiled("summarize")
+    def summarize(
+        jsonline: str, stats: List[str], x: str, type_: str, window: int
+    ) -> List[Any]:
+        aggregations = [Aggregation(spec, window) for spec in stats]
+        ys = list(dict.fromkeys(a.y for a in aggregations))
+        for parsed in JsonlineReader(jsonline).iter_parsed_with(ys):
+            if type_ and parsed.get("type") != type_:
+                continue
+            some_x = parsed.get(x)
+            for aggregation in aggregations:
+                aggregation.add(some_x, parsed.get(aggregation.y))
+        return [aggregation.result() for aggregation in aggregations]
+
+    def run(
+        self,
+        stats: List[str],
+        x: str = "epoch",
+        type_: str = "",
+        window: int = 0,
+        jsonline_dir: str = "",
+        workers: int = 0,
+    ) -> None:
+        # fail early on bad statistics
+        for spec in stats:
+            Aggregation(spec)
+        configs = self.parse_input(jsonline_dir)
+        # the info of subset json files are columns too
+        subset_info: List[Dict[str, Any]] = []
+        loaded: Dict[str, Dict] = {}
+        for name, subset_json, _ in configs:
+            info = {}
+            if subset_json:
+                info = load_subset_info(subset_json, name, loaded)
+            subset_info.append(info)
+        info_columns = list(dict.fromkeys(k for info in subset_info for k in info))
+
+        args: List[List[Any]] = [
+            [jsonline for _, _, jsonline in configs],
+            [stats] * len(configs),
+            [x] * len(configs),
+            [type_] * len(configs),
+            [window] * len(configs),
+        ]
+        if workers > 1:
+            with futures.ProcessPoolExecutor(workers) as executor:
+                results = list(executor.map(self.summarize, *args))
+        else:
+            results = list(map(self.summarize, *args))
+
+        def to_str(value: Any) -> str:
+            if value is None:
+                return ""
+            return value if isinstance(value, str) else JSON.dumps(value)
+
+        with open_output(self.outfile) as OUT:
+            print("\t".join(["name", *info_columns, *stats]), file=OUT)
+            for (name, _, _), info, result in zip(configs, subset_info, results):
+                row = [name, *(info.get(k) for k in info_columns), *result]
+                print("\t".join(map(to_str, row)), file=OUT)
+
+
 @click.group()
-def cli():
-    pass
+@click.option(
+    "--json-backend",
+    type=click.Choice(JsonBackend.names),
+    default="auto",
+    envvar="JSONLINE_JSON_BACKEND",
+    show_default=True,
+    help="json library used to read/write jsonlines",
+)
+@click.option(
+    "--jsonline-cache/--no-jsonline-cache",
+    default=False,
+    envvar="JSONLINE_CACHE",
+    show_default=True,
+    help="read jsonlines to plot from a columnar cache (<jsonline>.columns)",
+)
+@click.option(
+    "--jsonline-index/--no-jsonline-index",
+    default=False,
+    envvar="JSONLINE_INDEX",
+    show_default=True,
+    help="decode only the needed lines of jsonlines, by an index (<jsonline>.idx.npz)",
+)
+@click.option(
+    "--profile/--no-profile",
+    default=False,
+    envvar="JSONLINE_PROFILE",
+    show_default=True,
+    help="print timings of stages, records, bytes read and peak RSS as a json line (stderr)",
+)
+@click.option(
+    "--profile-output",
+    default="",
+    envvar="JSONLINE_PROFILE_OUTPUT",
+    help="append the json line of --profile to this file instead of stderr",
+)
+@click.option("--cprofile", default="", help="dump cProfile stats to this file")
+@click.option(
+    "--memo-dir",
+    default="",
+    envvar="JSONLINE_MEMO_DIR",
+    help="skip commands whose inputs are unchanged, outputs are copied from this store",
+)
+@click.option(
+    "--memo-max-mb",
+    default=2048,
+    envvar="JSONLINE_MEMO_MAX_MB",
+    show_default=True,
+    help="size of --memo-dir, least recently used outputs are removed, 0: no limit",
+)
+@click.option(
+    "--memo-digest",
+    type=click.Choice(MemoStore.digests),
+    default="content",
+    envvar="JSONLINE_MEMO_DIGEST",
+    show_default=True,
+    help="fingerprint of input files, content: hash, stat: path + size + mtime",
+)
+@click.pass_context
+def cli(
+    ctx,
+    json_backend,
+    jsonline_cache,
+    jsonline_index,
+    profile,
+    profile_output,
+    cprofile,
+    memo_dir,
+    memo_max_mb,
+    memo_digest,
+):
+    set_json_backend(json_backend)
+    if memo_dir:
+        MEMO.open(memo_dir, max_bytes=memo_max_mb << 20, digest=memo_digest)
+    JsonlineReader.use_cache = jsonline_cache
+    JsonlineReader.use_index = jsonline_index
+    if profile or cprofile:
+        PROFILER.start(ctx.invoked_subcommand or "", cprofile=bool(cprofile))
+        ctx.call_on_close(
+            lambda: PROFILER.stop(profile_output if profile else None, cprofile)
+        )
 
 
 @cli.command("normalize-old-formats")
-@click.option("-i", "--infile", required=True)
-@click.option("-o", "--outfile", required=True)
+@click.option("-i", "--infile", required=True, help="`-` for stdin")
+@click.option("-o", "--outfile", required=True, help="`-` for stdout")
 def parse_xlsx(infile, outfile):
-    TemporaryConverter(infile, outfile).run()
+    MEMO.run(
+        "normalize-old-formats",
+        {},
+        [("path", infile)],
+        [outfile],
+        TemporaryConverter(infile, outfile).run,
+    )
 
 
 @cli.command("rescue-normalized-file")
-@click.option("-i", "--infile", required=True)
-@click.option("-o", "--outfile", required=True)
-def rescue(infile, outfile):
-    Transformer(infile, outfile).run()
+@click.option("-i", "--infile", required=True, help="`-` for stdin")
+@click.option("-o", "--outfile", required=True, help="`-` for stdout")
+@click.option(
+    "--streaming/--two-pass",
+    default=False,
+    help="read infile only once (always on for stdin)",
+)
+def rescue(infile, outfile, streaming):
+    MEMO.run(
+        "rescue-normalized-file",
+        {},
+        [("path", infile)],
+        [outfile],
+        lambda: Transformer(infile, outfile).run(streaming=streaming),
+    )
+
+
+@cli.command(
+    "normalize-and-rescue",
+    help="normalize-old-formats + rescue-normalized-file, without intermediate file",
+)
+@click.option("-i", "--infile", required=True, help="`-` for stdin")
+@click.option("-o", "--outfile", required=True, help="`-` for stdout")
+@click.option(
+    "--format",
+    "out_format",
+    type=click.Choice(NormalizeRescue.formats),
+    default="jsonline",
+    show_default=True,
+)
+def normalize_and_rescue(infile, outfile, out_format):
+    MEMO.run(
+        "normalize-and-rescue",
+        {"format": out_format},
+        [("path", infile)],
+        [outfile],
+        lambda: NormalizeRescue(infile, outfile).run(out_format),
+    )
+
+
+@cli.command(
+    "normalize-and-rescue-batch",
+    help="normalize-and-rescue for many files (or globs) with a process pool",
+)
+@click.option("-o", "--outdir", default=None, help="default: next to each infile")
+@click.option("--suffix", default=".rescued", show_default=True)
+@click.option("-j", "--workers", default=0, help="default: number of cpus")
+@click.option(
+    "--chunk-size",
+    default=64,
+    show_default=True,
+    help="MB, big files are split into chunks of this size",
+)
+@click.argument("infiles", type=str, nargs=-1, required=True)
+def normalize_and_rescue_batch(outdir, suffix, workers, chunk_size, infiles):
+    all_infiles: List[str] = []
+    for infile in infiles:
+        all_infiles.extend(
+            sorted(glob.glob(infile)) if glob.has_magic(infile) else [infile]
+        )
+    BatchNormalizeRescue(all_infiles, outdir, suffix).run(
+        workers=workers, chunk_size=chunk_size << 20
+    )
 
 
 @cli.command("plot-jsonline")
-@click.option("-i", "--infile", required=True)
+@click.option("-i", "--infile", required=True, help="`-` for stdin")
 @click.option("-o", "--outfile", required=True)
 @click.option("--sns-context", default="talk")
 @click.option("--sns-palette", default="Reds")
@@ -561,6 +3670,41 @@ def rescue(infile, outfile):
 @click.option("--ys", default="valid,train,lr")
 @click.option("--class-name", default="Plot")
 @click.option("--fig-size", default="12,8")
+@click.option(
+    "--follow",
+    is_flag=True,
+    help="plot again every --interval seconds, only new lines of infile are read",
+)
+@click.option("--interval", default=30.0, show_default=True, help="seconds")
+@click.option("--max-refreshes", default=0, help="with --follow, 0 is forever")
+@click.option(
+    "--max-points",
+    default=0,
+    help="downsample every line to about this number of points, 0 is off",
+)
+@click.option(
+    "--downsample",
+    type=click.Choice(DOWNSAMPLE_METHODS),
+    default="minmax",
+    show_default=True,
+)
+@click.option(
+    "--ci/--no-ci",
+    default=True,
+    show_default=True,
+    help="confidence interval of sns.lineplot",
+)
+@click.option(
+    "--estimator",
+    default="mean",
+    show_default=True,
+    help="aggregation of sns.lineplot, `none` to draw every point",
+)
+@click.option(
+    "--follow-state",
+    default=None,
+    help="with --follow, file to keep what is read between runs",
+)
 @click.argument("any_info", type=str, default="")
 def generate_shell(
     infile,
@@ -572,19 +3716,39 @@ def generate_shell(
     class_name,
     any_info,
     fig_size,
+    follow,
+    interval,
+    max_refreshes,
+    follow_state,
+    max_points,
+    downsample,
+    ci,
+    estimator,
 ):
     Plot_class = globals()[class_name]
     kwargs = {}
     if any_info:
         kwargs = {"any_info": any_info}
-    Plot_class(infile, outfile).run(
+    plot = Plot_class(infile, outfile)
+    run_kwargs = dict(
         context=sns_context,
         palette=sns_palette,
         x=x,
         y=ys.split(","),
         figsize=fig_size.split(","),
+        max_points=max_points,
+        downsample=downsample,
+        ci=ci,
+        estimator=None if estimator == "none" else estimator,
         **kwargs,
     )
+    if follow:
+        plot.reader = FollowingJsonlineReader(infile, follow_state)
+        plot.follow(interval=interval, max_refreshes=max_refreshes, **run_kwargs)
+    else:
+        memoized_plot(
+            Plot_class, infile, outfile, run_kwargs, lambda: plot.run(**run_kwargs)
+        )
 
 
 @cli.command("plot-jsonline2", help="use jsonnet")
@@ -593,26 +3757,221 @@ def generate_shell(
 def generate_shell(any_info, config_json):
     with open(config_json) as IN:
         json_config = json.load(IN)
-
-    def j(spec):
-        return glom.glom(json_config, spec)
-
-    Plot_class = globals()[j("class_name")]
-    kwargs = {}
-    if any_info:
-        kwargs = {"any_info": any_info}
-    Plot_class(j("infile"), j("outfile")).run(
-        **j("sns"),
-        **kwargs,
+    plot_from_config(json_config, any_info)
+
+
+@cli.command(
+    "plot-jsonline2-batch", help="plot-jsonline2 of many configs in one process"
+)
+@click.option(
+    "-j",
+    "--workers",
+    default=0,
+    show_default=True,
+    help="processes, configs with the same infile go to the same process",
+)
+@click.option(
+    "--max-cache-mb",
+    default=0,
+    show_default=True,
+    help="memory of loaded jsonlines kept per process, 0: no limit",
+)
+@click.option(
+    "--any-info",
+    default="",
+    help='any_info of plot-jsonline2, unless the config has its own "any_info"',
+)
+@click.argument("configs", nargs=-1, required=True)
+def plot_jsonline2_batch(workers, max_cache_mb, any_info, configs):
+    """CONFIGS: config jsons, folders of them, or files listing them (one per line)"""
+    failed = BatchPlotter(list(configs)).run(
+        any_info, workers=workers, max_bytes=max_cache_mb << 20
     )
+    if failed:
+        sys.exit(1)
+
+
+@cli.command("serve", help="render plot-jsonline2 configs on request (POST /plot)")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8765, show_default=True, help="0: any free port")
+@click.option(
+    "--socket", "socket_path", default="", help="unix socket, instead of host:port"
+)
+@click.option(
+    "-j",
+    "--workers",
+    default=2,
+    show_default=True,
+    help="processes to render, 0: number of cpus",
+)
+@click.option(
+    "--max-cache-mb",
+    default=1024,
+    show_default=True,
+    help="memory of loaded jsonlines kept per process, 0: no limit",
+)
+@click.option(
+    "--max-image-mb",
+    default=256,
+    show_default=True,
+    help="memory of rendered images kept, 0: no limit",
+)
+@click.option(
+    "--any-info",
+    default="",
+    help='any_info of plot-jsonline2, unless the config has its own "any_info"',
+)
+def serve(host, port, socket_path, workers, max_cache_mb, max_image_mb, any_info):
+    PlotServer(
+        any_info,
+        workers=workers,
+        max_bytes=max_cache_mb << 20,
+        max_image_bytes=max_image_mb << 20,
+    ).serve(host, port, socket_path)
 
 
 @cli.command("from-confusion-matrix-to-jsonline")
 @click.option("-i", "--infile", required=True)
 @click.option("-o", "--outfile", required=True)
+@click.option(
+    "--extra-metrics",
+    is_flag=True,
+    help="also output {label}_precision and {label}_f1",
+)
 @click.argument("any_info", type=str, nargs=-1)
-def from_confusion_matrix_to_jsonline(infile, outfile, any_info):
-    ConfusionMatrix(infile, outfile).run(any_info)
+def from_confusion_matrix_to_jsonline(infile, outfile, extra_metrics, any_info):
+    MEMO.run(
+        "from-confusion-matrix-to-jsonline",
+        {"extra_metrics": extra_metrics, "any_info": list(any_info)},
+        [("path", infile)],
+        [outfile],
+        lambda: ConfusionMatrix(infile, outfile).run(
+            any_info, extra_metrics=extra_metrics
+        ),
+    )
+
+
+@cli.command(
+    "from-confusion-matrix-folders-to-jsonline",
+    help="from-confusion-matrix-to-jsonline for every folder of a folder list",
+)
+@click.option("-i", "--infile", required=True, help="folder list, see CombinedPlotter")
+@click.option(
+    "-o",
+    "--outfile",
+    required=True,
+    help="output folder, or output file with --combined",
+)
+@click.option(
+    "--combined",
+    is_flag=True,
+    help="write one jsonline, with json file name of each folder as `name`",
+)
+@click.option("--threads", default=16, show_default=True, help="to read csv files")
+@click.option(
+    "--extra-metrics",
+    is_flag=True,
+    help="also output {label}_precision and {label}_f1",
+)
+@click.argument("any_info", type=str, nargs=-1)
+def from_confusion_matrix_folders_to_jsonline(
+    infile, outfile, combined, threads, extra_metrics, any_info
+):
+    folders = ConfusionMatrixFolders(infile, outfile)
+    MEMO.run(
+        "from-confusion-matrix-folders-to-jsonline",
+        {
+            "combined": combined,
+            "extra_metrics": extra_metrics,
+            "any_info": list(any_info),
+        },
+        [("list+folders", infile)],
+        [outfile] if combined or infile == "-" else folders.outfiles(),
+        lambda: folders.run(
+            any_info, combined=combined, threads=threads, extra_metrics=extra_metrics
+        ),
+    )
+
+
+@cli.command(
+    "find-confusion-matrix-folders",
+    help="folder list (see CombinedPlotter) of the run folders in ROOT",
+)
+@click.option("-o", "--outfile", required=True, help="`-` for stdout")
+@click.option(
+    "--pattern",
+    default=r"^config\..+\.json$",
+    show_default=True,
+    help="regex of the names of run folders",
+)
+@click.option(
+    "--json-dir",
+    "json_dirs",
+    multiple=True,
+    help="folders of the json files of runs, in order, default: ROOT/json_output",
+)
+@click.option("--name", default="confuse_matrix", show_default=True)
+@click.option("--threads", default=32, show_default=True)
+@click.option(
+    "--missing-json",
+    type=click.Choice(ConfusionMatrixFinder.missing_json_actions),
+    default="keep",
+    show_default=True,
+    help="if no json dir has the json file of a run",
+)
+@click.option(
+    "--include", multiple=True, help="only json files matching any of these regexes"
+)
+@click.option("--exclude", multiple=True, help="no json files matching these regexes")
+@click.argument("root", type=str)
+def find_confusion_matrix_folders(
+    outfile, pattern, json_dirs, name, threads, missing_json, include, exclude, root
+):
+    ConfusionMatrixFinder(root, outfile).run(
+        pattern,
+        list(json_dirs),
+        name=name,
+        threads=threads,
+        missing_json=missing_json,
+        include=list(include),
+        exclude=list(exclude),
+    )
+
+
+@cli.command(
+    "subset-json-batch",
+    help="subset-json of many config jsons (or globs), into one index",
+)
+@click.option("-o", "--outfile", required=True, help="index of all subsets")
+@click.option(
+    "--outdir",
+    default=None,
+    help="also write <outdir>/<config json name>.subset.json",
+)
+@click.option("--threads", default=16, show_default=True)
+@click.option("-s", "--spec", "specs", multiple=True, required=True)
+@click.argument("infiles", type=str, nargs=-1, required=True)
+def subset_json_batch(outfile, outdir, threads, specs, infiles):
+    all_infiles: List[str] = []
+    for infile in infiles:
+        all_infiles.extend(
+            sorted(glob.glob(infile)) if glob.has_magic(infile) else [infile]
+        )
+    outputs = [outfile]
+    if outdir:
+        outputs.extend(
+            str(Path(outdir) / f"{Path(infile).name}.subset.json")
+            for infile in all_infiles
+        )
+    MEMO.run(
+        "subset-json-batch",
+        {"specs": list(specs)},
+        [("path", infile) for infile in all_infiles],
+        outputs,
+        lambda: BatchSubsetJson(all_infiles, outfile).run(
+            list(specs), threads=threads, outdir=outdir
+        ),
+    )
 
 
 @cli.command("subset-json")
@@ -620,7 +3979,67 @@ def from_confusion_matrix_to_jsonline(infile, outfile, any_info):
 @click.option("-o", "--outfile", required=True)
 @click.argument("specs", type=str, nargs=-1)
 def subset_json(infile, outfile, specs):
-    SubsetJson(infile, outfile).run(specs)
+    MEMO.run(
+        "subset-json",
+        {"specs": list(specs)},
+        [("path", infile)],
+        [outfile],
+        lambda: SubsetJson(infile, outfile).run(specs),
+    )
+
+
+@cli.command("summarize-jsonlines", help="statistics of many jsonlines, no plotting")
+@click.option(
+    "-i",
+    "--infile",
+    required=True,
+    help="subset_json_list (3 columns) or folder list (2 columns)",
+)
+@click.option(
+    "-o", "--outfile", default="-", show_default=True, help="tsv, `-` for stdout"
+)
+@click.option(
+    "-s",
+    "--stat",
+    "stats",
+    multiple=True,
+    required=True,
+    help=f"AGG:Y, AGG is one of {', '.join(Aggregation.names)}, e.g. max:acc",
+)
+@click.option("--x", default="epoch", show_default=True, help="for argmax/last/window")
+@click.option("--type", "type_", default="", help="only records of this type, e.g. val")
+@click.option(
+    "--window",
+    default=0,
+    show_default=True,
+    help="mean of the last WINDOW records (by x), 0: all records",
+)
+@click.option(
+    "--jsonline-dir",
+    default="",
+    help="folder of <json file name>.cf_jsonline, for a folder list",
+)
+@click.option("-j", "--workers", default=0, show_default=True, help="processes")
+def summarize_jsonlines(
+    infile, outfile, stats, x, type_, window, jsonline_dir, workers
+):
+    inputs = [("list", infile)]
+    if jsonline_dir:
+        inputs.append(("path", jsonline_dir))
+    MEMO.run(
+        "summarize-jsonlines",
+        {"stats": list(stats), "x": x, "type": type_, "window": window},
+        inputs,
+        [outfile],
+        lambda: Summary(infile, outfile).run(
+            list(stats),
+            x=x,
+            type_=type_,
+            window=window,
+            jsonline_dir=jsonline_dir,
+            workers=workers,
+        ),
+    )
 
 
 if __name__ == "__main__":
@@ -15,40 +15,19 @@ include {
 process get_confusion_matrix_folders {
   publishDir "./data", mode: 'symlink'
 
+  input:
+    file python_script
+
   output:
     path "${params.folder_list}", emit: folder_list
 
   script:
     """
-    #! python
-    from pathlib import Path
-    import re
-
-    pat = re.compile("^config\\.1[0-7]\\.([\\d_]+)\\.json\$")
-    # folder of basedir
-    file1 = Path("/mnt/GPU1-raid0/zhaomeng-from-GPU3/projects/20220128-fl/Federated_learning/Tdeeppath/temp")
-
-    def get_json_file(json_folder: Path) -> Path:
-      return file1 / "json_output" / json_folder.name
-
-    with open("${params.folder_list}", 'w') as OUT:
-      for folder in sorted(file1.iterdir()):
-        if pat.match(folder.name):
-          # glob for confusion_matrix folder, a.k.a 'confuse_matrix'
-          confusion_matrix_folder = list(folder.rglob("confuse_matrix"))
-
-          # only write to output if found
-          if confusion_matrix_folder:
-            json_file = get_json_file(folder)
-            if not json_file.is_file():
-              print(f"Cannot find json file: {json_file}")
-            print(f"{confusion_matrix_folder[0].absolute()}\\t{json_file}", file=OUT)
-          else:
-            # don't fail, only warn to stdout
-            print(f"Cannot find confusion_matrix folder in {folder}")
-        else:
-          # debug purpose
-          print(f"skip {folder.absolute()}")
+    # folder of basedir, warns about runs without a confusion_matrix folder (a.k.a 'confuse_matrix')
+    python ${python_script} find-confusion-matrix-folders \
+      -o ${params.folder_list} \
+      --pattern '^config\\.1[0-7]\\.([\\d_]+)\\.json\$' \
+      /mnt/GPU1-raid0/zhaomeng-from-GPU3/projects/20220128-fl/Federated_learning/Tdeeppath/temp
     """
 
 }
@@ -306,7 +285,7 @@ workflow single_plots_workflow {
 workflow single_plots_each_folder2 {
   def helper_py = get_helper_py()
 
-  get_confusion_matrix_folders()
+  get_confusion_matrix_folders(helper_py)
 
   // first convert to jsonlines
   convert_to_jsonline_workflow(get_confusion_matrix_folders.out.folder_list, helper_py)
@@ -325,7 +304,7 @@ workflow single_plots_each_folder2 {
 workflow single_plots_each_folder {
   def helper_py = get_helper_py()
 
-  get_confusion_matrix_folders()
+  get_confusion_matrix_folders(helper_py)
 
   // 使用flatMap读取了folder_list这个文件
   // 并将每行的第一个field（也就是confusion_matrix_folder）作为单个item导入到dataflow中
@@ -469,7 +448,7 @@ workflow run_combine_plot {
   def helper_py = get_helper_py()
   def plot_jsonnet = get_plot_jsonnet()
 
-  get_confusion_matrix_folders()
+  get_confusion_matrix_folders(helper_py)
 
   get_confusion_matrix_folders.out.folder_list.view {
     println "File ${it} created."